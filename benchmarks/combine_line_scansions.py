@@ -0,0 +1,51 @@
+"""
+Compares the scaling of the 'greedy' and 'incremental' methods of combine_line_scansions on poems of 10 to 500
+lines in which many lines are split in two or three parts.
+
+Run from the root of the repository with: python -m benchmarks.combine_line_scansions
+"""
+import random
+import timeit
+from src.meter import combine_line_scansions
+
+
+def generate_scansion_list(n_lines, seed=0):
+    """
+    Returns a list with the scansions of a poem with n_lines lines in alternating tetrameter and trimeter,
+    where about a third of the lines is split in two or three parts.
+    """
+    rng = random.Random(seed)
+    scansion_list = []
+    while len(scansion_list) < n_lines:
+        line = "01010101" if len(scansion_list) % 2 == 0 else "010101"
+        r = rng.random()
+        if r < 0.2:
+            i = rng.randint(1, len(line) - 1)
+            scansion_list += [line[:i], line[i:]]
+        elif r < 0.35:
+            i = rng.randint(1, len(line) - 2)
+            j = rng.randint(i + 1, len(line) - 1)
+            scansion_list += [line[:i], line[i:j], line[j:]]
+        else:
+            scansion_list.append(line)
+    return scansion_list[:n_lines]
+
+
+def main():
+    print(f"{'lines':>6} {'greedy (ms)':>12} {'incremental (ms)':>17} {'speedup':>8}")
+    for n_lines in [10, 20, 50, 100, 200, 500]:
+        scansion_list = generate_scansion_list(n_lines)
+        assert combine_line_scansions(scansion_list, method="greedy") == combine_line_scansions(scansion_list)
+        timings = {}
+        for method in ["greedy", "incremental"]:
+            timer = timeit.Timer(lambda: combine_line_scansions(scansion_list, method=method))
+            number, _ = timer.autorange()
+            timings[method] = min(timer.repeat(repeat=3, number=number)) / number * 1000
+        print(
+            f"{n_lines:>6} {timings['greedy']:>12.2f} {timings['incremental']:>17.2f} "
+            f"{timings['greedy'] / timings['incremental']:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Seeded generator for synthetic Reddit comments, with the same columns as the DataFrame returned by
+RedditUserCommentReader.read().
+"""
+import random
+import pandas as pd
+
+words = (
+    "the and i you a to of it in my that was he is his for with but on so be me as all had not they at "
+    "timmy day way time night light away life wife said dead head bed more door floor before poor know go "
+    "snow though told old cold gold fine mine line wine rhyme climb high sky die why try fly eye bright sight "
+    "heart apart start part love above dove fire desire tired hurried youth truth quickly moved another year "
+    "throw chains oppression fairly unfettered free poem reddit comment upvote people dog cat little "
+    "sprog fucking died television poetry beautiful remember whatever happened wonder thunder"
+).split()
+subreddits = ["r/AskReddit", "r/funny", "r/pics", "r/aww", "r/gaming", "r/todayilearned", "r/WritingPrompts"]
+award_names = ["Silver", "Gold", "Platinum", "Helpful", "Wholesome", "Hugz", "Take My Energy"]
+
+
+def generate_comments(n, seed=0, author="poem_for_your_sprog"):
+    """
+    Returns a DataFrame with n synthetic comments. Most comments are poems with markdown line breaks, and some
+    contain quotes, URLs, links to subreddits, HTML entities, non-ASCII characters and deleted authors.
+    """
+    rng = random.Random(seed)
+    created_utc = 1300000000
+    rows = []
+    for i in range(n):
+        created_utc += rng.randint(10, 600)
+        deleted = rng.random() < 0.02
+        rows.append(
+            {
+                "id": _base36(i),
+                "author": "[deleted]" if deleted else author,
+                "body": "[deleted]" if deleted else _generate_body(rng),
+                "created_utc": float(created_utc),
+                "all_awardings": _generate_awardings(rng),
+                "ups": int(rng.paretovariate(1.2)) - 1,
+                "score": 0,
+                "subreddit_name_prefixed": rng.choice(subreddits),
+                "link_id": "t3_" + _base36(rng.randint(0, 10**8)),
+                "parent_id": "t1_" + _base36(rng.randint(0, 10**8)),
+            }
+        )
+    df = pd.DataFrame(rows)
+    df["score"] = df["ups"]
+    return df
+
+
+def _generate_body(rng):
+    if rng.random() < 0.15:
+        # Prose comment
+        return " ".join(rng.choice(words) for _ in range(rng.randint(5, 80))).capitalize() + "."
+
+    lines = []
+    for _ in range(rng.randint(2, 16)):
+        line = " ".join(rng.choice(words) for _ in range(rng.randint(3, 9)))
+        line = line.capitalize() + rng.choice(["", "", ",", ".", "!", "?", "...", " -", "’s"])
+        if rng.random() < 0.1:
+            line = f"*{line}*"
+        lines.append(line)
+    body = "".join(line + rng.choice(["  \n", "  \n", "\n\n", "\n"]) for line in lines).rstrip()
+
+    if rng.random() < 0.1:
+        body = f"&gt;{' '.join(rng.choice(words) for _ in range(8))}\n\n{body}"
+    if rng.random() < 0.05:
+        body += f"\n\n[link](https://www.reddit.com/{rng.choice(subreddits)}/comments/{_base36(rng.randint(0, 10**8))})"
+    if rng.random() < 0.05:
+        body += f"\n\n&amp;nbsp;\n\nSee /{rng.choice(subreddits)}"
+    if rng.random() < 0.03:
+        body += " \U0001F622 “the end”"
+    return body
+
+
+def _generate_awardings(rng):
+    if rng.random() < 0.8:
+        return []
+    names = rng.sample(award_names, rng.randint(1, 3))
+    return [{"name": name, "count": rng.randint(1, 20)} for name in names]
+
+
+def _base36(x):
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    result = ""
+    while True:
+        x, r = divmod(x, 36)
+        result = digits[r] + result
+        if x == 0:
+            return result
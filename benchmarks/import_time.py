@@ -0,0 +1,67 @@
+"""
+Measures the time to import the src modules with 'python -X importtime', each in a fresh interpreter, and which of
+the heavy dependencies are imported along with them. With src.lazy, none of them should be.
+
+Run from the root of the repository with:
+
+    python -m benchmarks.import_time [--modules src.meter src.rhyme] [--repeat 5] [--max-ms 150]
+
+With --max-ms, the run exits with status 1 if importing a module takes longer than that.
+"""
+import argparse
+import re
+import subprocess
+import sys
+
+default_modules = ["src.meter", "src.rhyme", "src.plotly", "src.reddit_user_comment_reader", "src.pipeline", "src.cli"]
+heavy_dependencies = ["numpy", "pandas", "plotly", "pronouncing", "requests"]
+_import_time_line = re.compile(r"^import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def measure(module):
+    """
+    Returns the cumulative import time of 'module' in milliseconds, and the heavy dependencies that were imported
+    at the top level.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True, check=True
+    )
+    milliseconds = None
+    imported = set()
+    for line in result.stderr.splitlines():
+        match = _import_time_line.match(line)
+        if match is None:
+            continue
+        cumulative_us, indent, name = match.groups()
+        if name == module and not indent:
+            milliseconds = int(cumulative_us) / 1000
+        if name in heavy_dependencies:
+            imported.add(name)
+    return milliseconds, sorted(imported)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Measure the import time of the src modules.")
+    parser.add_argument("--modules", nargs="+", default=default_modules, help="Modules to import.")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of imports per module, the fastest is reported.")
+    parser.add_argument("--max-ms", type=float, help="Maximum allowed import time in milliseconds.")
+    args = parser.parse_args(argv)
+
+    print(f"{'module':<34} {'time (ms)':>10}  heavy dependencies imported")
+    too_slow = []
+    for module in args.modules:
+        measurements = [measure(module) for _ in range(args.repeat)]
+        milliseconds = min(x[0] for x in measurements)
+        imported = measurements[0][1]
+        print(f"{module:<34} {milliseconds:>10.1f}  {', '.join(imported) or '-'}")
+        if args.max_ms is not None and milliseconds > args.max_ms:
+            too_slow.append(module)
+
+    if too_slow:
+        print(f"Slower than {args.max_ms} ms: {', '.join(too_slow)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,50 @@
+"""
+Compares the queries of the 'what about Timmy' analysis, a linear scan over all poems, with queries on an
+InvertedIndex, and the word counts of concatenating and tokenizing the whole corpus with InvertedIndex.most_common.
+
+Run from the root of the repository with: python -m benchmarks.inverted_index [n_comments ...]
+"""
+import re
+import sys
+import time
+from collections import Counter
+from benchmarks.corpus import generate_comments
+from src.data_frame_parser import DataFrameParser
+from src.inverted_index import InvertedIndex
+
+queries = ["timmy", "timmy fucking died", "but he", "the"]
+
+
+def time_per_call(function, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+def main(sizes):
+    print(f"{'comments':>9} {'query':<20} {'scan (ms)':>10} {'index (ms)':>11} {'poems':>7}")
+    for n in sizes:
+        poems = DataFrameParser().parse(generate_comments(n))["poem"]
+        start = time.perf_counter()
+        index = InvertedIndex()
+        index.add(poems)
+        build_time = time.perf_counter() - start
+
+        for query in queries:
+            scan_time = time_per_call(lambda: [query in poem for poem in poems], repeat=3)
+            index.search(query)  # Exclude building the position arrays of a phrase query.
+            index_time = time_per_call(lambda: index.search(query))
+            n_poems = index.document_frequency(query)
+            print(f"{n:>9} {query:<20} {scan_time * 1e3:>10.2f} {index_time * 1e3:>11.3f} {n_poems:>7}")
+
+        concatenate_time = time_per_call(
+            lambda: Counter(re.findall(r"\w+", poems.str.cat(sep=" "))).most_common(80), repeat=3
+        )
+        most_common_time = time_per_call(lambda: index.most_common(80))
+        print(f"{n:>9} {'80 most common words':<20} {concatenate_time * 1e3:>10.2f} {most_common_time * 1e3:>11.3f}")
+        print(f"{n:>9} {'build index':<20} {'':>10} {build_time * 1e3:>11.0f}")
+
+
+if __name__ == "__main__":
+    main([int(x) for x in sys.argv[1:]] or [10000, 100000])
@@ -0,0 +1,64 @@
+"""
+Measures the per-query latency of PhonemeSuffixTrie.search for distances 0 to 2, and compares it to a linear scan
+that computes the edit distance to every rhyming part in the dictionary, after checking that both give the same
+near rhymes. The linear scan is only timed on the first 'n_linear' queries, since it takes about 0.3 seconds each.
+
+Run from the root of the repository with: python -m benchmarks.near_rhymes
+"""
+import time
+import pronouncing
+from benchmarks.corpus import words
+from src.rhyme_trie import PhonemeSuffixTrie, to_key
+
+
+def search_linear(trie, rhyming_part, max_distance):
+    """
+    Returns the same result as trie.search, by computing the edit distance to every key in the trie.
+    """
+    target = to_key(rhyming_part).split(" ")
+    results = {}
+    for key in trie.words_per_key:
+        distance = edit_distance(target, key.split(" "))
+        if distance <= max_distance:
+            results[key] = distance
+    return results
+
+
+def edit_distance(a, b):
+    row = list(range(len(b) + 1))
+    for i, x in enumerate(a, start=1):
+        previous_row, row = row, [i]
+        for j, y in enumerate(b, start=1):
+            row.append(min(row[j - 1] + 1, previous_row[j] + 1, previous_row[j - 1] + (x != y)))
+    return row[-1]
+
+
+def main(n_linear=20):
+    start = time.perf_counter()
+    trie = PhonemeSuffixTrie.build()
+    print(f"Built trie with {len(trie.words_per_key)} rhyming parts in {time.perf_counter() - start:.2f} s\n")
+
+    rhyming_parts = [pronouncing.rhyming_part(phones) for word in words for phones in pronouncing.phones_for_word(word)]
+    print(f"{'distance':>8} {'trie (ms)':>10} {'linear (ms)':>12} {'speedup':>8} {'matches':>8}")
+    for max_distance in [0, 1, 2]:
+        timings = {}
+        for name, search, queries in [
+            ("trie", trie.search, rhyming_parts),
+            ("linear", lambda x, d: search_linear(trie, x, d), rhyming_parts[:n_linear]),
+        ]:
+            start = time.perf_counter()
+            results = [search(rhyming_part, max_distance) for rhyming_part in queries]
+            timings[name] = (time.perf_counter() - start) / len(queries) * 1000
+            if name == "trie":
+                expected = results
+            elif results != expected[:n_linear]:
+                raise AssertionError("The trie and the linear scan find different near rhymes.")
+        n_matches = sum(len(x) for x in expected) / len(expected)
+        print(
+            f"{max_distance:>8} {timings['trie']:>10.3f} {timings['linear']:>12.2f} "
+            f"{timings['linear'] / timings['trie']:>7.0f}x {n_matches:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
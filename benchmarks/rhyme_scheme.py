@@ -0,0 +1,66 @@
+"""
+Checks that get_rhyme_scheme gives exactly the same schemes as the original implementation, which searches every
+last word in the lists returned by rhymes() and rhymes_all(), and compares their speed on poems of 10 to 500 lines.
+
+Run from the root of the repository with: python -m benchmarks.rhyme_scheme
+"""
+import random
+import string
+import timeit
+import numpy as np
+from benchmarks.corpus import words
+from src.rhyme import get_rhyme_scheme, rhymes, rhymes_all
+
+
+def get_rhyme_scheme_reference(last_words_per_line):
+    """
+    The original implementation of get_rhyme_scheme.
+    """
+    alphabet = string.ascii_lowercase
+    rhyme_scheme = np.empty(len(last_words_per_line), dtype=str)
+    k = 0
+    for i in range(len(last_words_per_line)):
+        if rhyme_scheme[i] == "":
+            if last_words_per_line[i] is not None:
+                rhyme_scheme[i] = alphabet[k % 26]
+                rhyme_list = rhymes(last_words_per_line[i])
+                if not np.any([x in rhyme_list for x in last_words_per_line]):
+                    rhyme_list = rhymes_all(last_words_per_line[i])
+                if np.any([x in rhyme_list for x in last_words_per_line]):
+                    rhyme_scheme[
+                        (np.array([x in rhyme_list for x in last_words_per_line]) & (rhyme_scheme == ""))
+                    ] = alphabet[k % 26]
+                k += 1
+            else:
+                rhyme_scheme[i] = "?"
+    return "".join(rhyme_scheme)
+
+
+def generate_last_words(n_lines, seed=0):
+    """
+    Returns the last words of a poem with n_lines lines, drawn from the vocabulary of the synthetic corpus with
+    some unknown and missing words.
+    """
+    rng = random.Random(seed)
+    vocabulary = words + ["Day", "timmy's", None]
+    return [rng.choice(vocabulary) for _ in range(n_lines)]
+
+
+def main():
+    print(f"{'lines':>6} {'reference (ms)':>15} {'keyed (ms)':>11} {'speedup':>8}")
+    for n_lines in [10, 20, 50, 100, 200, 500]:
+        last_words = generate_last_words(n_lines)
+        assert get_rhyme_scheme_reference(last_words) == get_rhyme_scheme(last_words)
+        timings = {}
+        for name, function in [("reference", get_rhyme_scheme_reference), ("keyed", get_rhyme_scheme)]:
+            timer = timeit.Timer(lambda: function(last_words))
+            number, _ = timer.autorange()
+            timings[name] = min(timer.repeat(repeat=3, number=number)) / number * 1000
+        print(
+            f"{n_lines:>6} {timings['reference']:>15.2f} {timings['keyed']:>11.2f} "
+            f"{timings['reference'] / timings['keyed']:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Runs every stage of the analysis on synthetic corpora from benchmarks.corpus, and reports per stage the time, the
+throughput and the peak memory allocated by Python. The results can be saved as a baseline and compared against
+later runs, to catch regressions.
+
+Run from the root of the repository with:
+
+    python -m benchmarks.run [--sizes 1000 100000 1000000] [--repeat 3] [--save-baseline PATH] [--baseline PATH]
+
+With --baseline, the run exits with status 1 if a stage is more than --tolerance (default 25%) slower than in the
+baseline at the same size. Baselines depend on the machine, so save one before making a change and compare after.
+"""
+import argparse
+import gc
+import json
+import sys
+import time
+import tracemalloc
+import pronouncing
+from benchmarks.corpus import generate_comments
+from src.data_frame_parser import DataFrameParser
+from src.meter import (
+    combine_line_scansions,
+    get_known_meter,
+    get_line_scansion,
+    known_meters_inv,
+    merge_lines,
+    word_scansion_cache,
+)
+from src.rhyme import extract_last_words, get_rhyme_schemes, rhyming_parts_cache
+
+
+def get_stages(n):
+    """
+    Returns the stages for a corpus of n comments, as a list of (name, setup, run) tuples. setup() returns the input
+    of the stage, which is not timed, and run(input) returns the number of rows processed.
+    """
+    state = {}
+
+    def setup_parse():
+        return generate_comments(n)
+
+    def run_parse(df):
+        state["df"] = DataFrameParser().parse(df)
+        return len(df)
+
+    def setup_line_scansion():
+        word_scansion_cache.clear()
+        return [line for poem in state["df"]["poem"] for line in poem.split(">")]
+
+    def run_line_scansion(lines):
+        for line in lines:
+            get_line_scansion(line)
+        return len(lines)
+
+    def setup_combine():
+        return [[get_line_scansion(line) for line in poem.split(">")] for poem in state["df"]["poem"]]
+
+    def run_combine(scansion_lists):
+        state["scansion_modified"] = [merge_lines(x, combine_line_scansions(x)) for x in scansion_lists]
+        return len(scansion_lists)
+
+    def setup_known_meter():
+        return state["scansion_modified"]
+
+    def run_known_meter(scansion_lists):
+        for scansion_list in scansion_lists:
+            get_known_meter(scansion_list, known_meters_inv)
+        return len(scansion_lists)
+
+    def setup_rhyme():
+        rhyming_parts_cache.clear()
+        return state["df"]["poem"]
+
+    def run_rhyme(poems):
+        get_rhyme_schemes(extract_last_words(poems))
+        return len(poems)
+
+    return [
+        ("parse", setup_parse, run_parse),
+        ("get_line_scansion", setup_line_scansion, run_line_scansion),
+        ("combine_line_scansions", setup_combine, run_combine),
+        ("get_known_meter", setup_known_meter, run_known_meter),
+        ("get_rhyme_scheme", setup_rhyme, run_rhyme),
+    ]
+
+
+def run(sizes, repeat=3, measure_memory=True):
+    """
+    Returns a list of dicts with per size and stage the fastest time in seconds of 'repeat' runs, the rows per
+    second, and, with measure_memory, the peak memory in MB. Memory is measured in a separate run of each stage,
+    since tracemalloc slows down the code it traces.
+    """
+    # Load the pronunciation dictionary up front, so its loading time does not count towards the first stage using it.
+    pronouncing.init_cmu()
+    results = []
+    for n in sizes:
+        for name, setup, run_stage in get_stages(n):
+            seconds = float("inf")
+            for _ in range(repeat):
+                data = setup()
+                gc.collect()
+                start = time.perf_counter()
+                rows = run_stage(data)
+                seconds = min(seconds, time.perf_counter() - start)
+            result = {"size": n, "stage": name, "rows": rows, "seconds": seconds, "rows_per_second": rows / seconds}
+            if measure_memory:
+                data = setup()
+                gc.collect()
+                tracemalloc.start()
+                run_stage(data)
+                result["peak_memory_mb"] = tracemalloc.get_traced_memory()[1] / 1e6
+                tracemalloc.stop()
+            results.append(result)
+            print_result(result)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns the results that are more than 'tolerance' slower than the baseline for the same size and stage.
+    """
+    baseline_seconds = {(x["size"], x["stage"]): x["seconds"] for x in baseline}
+    regressions = []
+    for result in results:
+        expected = baseline_seconds.get((result["size"], result["stage"]))
+        if expected is not None and result["seconds"] > expected * (1 + tolerance):
+            regressions.append({**result, "baseline_seconds": expected})
+    return regressions
+
+
+def print_result(result):
+    memory = f"{result['peak_memory_mb']:>10.1f}" if "peak_memory_mb" in result else f"{'-':>10}"
+    print(
+        f"{result['size']:>9} {result['stage']:<24} {result['rows']:>9} {result['seconds']:>9.2f} "
+        f"{result['rows_per_second']:>12.0f} {memory}"
+    )
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the stages of the analysis on synthetic comments.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000], help="Numbers of comments.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs per stage, the fastest is reported.")
+    parser.add_argument("--no-memory", action="store_true", help="Do not measure the peak memory.")
+    parser.add_argument("--save-baseline", help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", help="Compare the results to the baseline in this JSON file.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown relative to the baseline.")
+    args = parser.parse_args(argv)
+
+    print(f"{'comments':>9} {'stage':<24} {'rows':>9} {'time (s)':>9} {'rows/s':>12} {'peak (MB)':>10}")
+    results = run(args.sizes, repeat=args.repeat, measure_memory=not args.no_memory)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for x in regressions:
+            seconds, baseline_seconds = x["seconds"], x["baseline_seconds"]
+            print(
+                f"Regression: {x['stage']} at {x['size']} comments took {seconds:.2f} s, was {baseline_seconds:.2f} s"
+            )
+        if regressions:
+            return 1
+        print("No regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
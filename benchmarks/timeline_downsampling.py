@@ -0,0 +1,33 @@
+"""
+Compares the build time and JSON size of plot_timeline figures of per-comment timelines, without downsampling and
+with max_points=2000.
+
+Run from the root of the repository with: python -m benchmarks.timeline_downsampling [n_comments ...]
+"""
+import sys
+import time
+import pandas as pd
+from benchmarks.corpus import generate_comments
+from src.plotly import plot_timeline
+
+
+def build_and_serialize(x, y, max_points):
+    start = time.perf_counter()
+    fig = plot_timeline(x, y, "Upvotes per comment", "date", "upvotes", max_points=max_points)
+    size = len(fig.to_json())
+    return time.perf_counter() - start, size
+
+
+def main(sizes, max_points=2000):
+    print(f"{'points':>9} {'full (s)':>9} {'full (MB)':>10} {'lttb (s)':>9} {'lttb (MB)':>10}")
+    for n in sizes:
+        df = generate_comments(n)
+        x = pd.to_datetime(df["created_utc"], unit="s")
+        y = df["ups"]
+        full_time, full_size = build_and_serialize(x, y, None)
+        lttb_time, lttb_size = build_and_serialize(x, y, max_points)
+        print(f"{n:>9} {full_time:>9.2f} {full_size / 1e6:>10.2f} {lttb_time:>9.2f} {lttb_size / 1e6:>10.3f}")
+
+
+if __name__ == "__main__":
+    main([int(x) for x in sys.argv[1:]] or [10000, 100000, 1000000])
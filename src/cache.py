@@ -0,0 +1,98 @@
+import pickle
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Memoizes a function of a single argument, keeping at most 'maxsize' results and evicting the least recently used
+    one when the cache is full. Unlike functools.lru_cache, the cache keeps its hit and miss counters accessible,
+    can be pre-warmed from a list of keys and can be saved to and loaded from disk, so a fresh process does not
+    have to start cold.
+
+    function: The function to memoize, called as function(key) on a cache miss.
+    maxsize: The maximum number of results to keep. None means unbounded.
+
+    Example:
+
+    > cache = LRUCache(len, maxsize=2)
+    > cache('abc'), cache('abc')
+    > (3, 3)
+    > cache.info()
+    > {'hits': 1, 'misses': 1, 'hit_rate': 0.5, 'size': 1, 'maxsize': 2}
+    """
+
+    def __init__(self, function, maxsize=None):
+        self.function = function
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def __call__(self, key):
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            value = self.function(key)
+            self._store(key, value)
+            return value
+        self.hits += 1
+        self._data.move_to_end(key)
+        return value
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def info(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
+
+    def warm(self, keys):
+        """
+        Compute and store the results for all keys that are not in the cache yet. Warming does not count towards
+        the hit and miss counters.
+        """
+        for key in keys:
+            if key not in self._data:
+                self._store(key, self.function(key))
+
+    def clear(self):
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def save(self, path):
+        """
+        Write the cached results to 'path', from least to most recently used.
+        """
+        with open(path, "wb") as f:
+            pickle.dump(list(self._data.items()), f)
+
+    def load(self, path):
+        """
+        Add the results stored in 'path' by save() to the cache. Entries already in the cache are overwritten.
+        """
+        with open(path, "rb") as f:
+            items = pickle.load(f)
+        for key, value in items:
+            self._store(key, value)
+
+    def _store(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if self.maxsize is not None:
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
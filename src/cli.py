@@ -0,0 +1,95 @@
+"""
+Command line interface to run the whole analysis as one batch job: read new comments, parse them and run the meter
+and rhyme analysis, e.g. from a scheduled job. Installed as the console script 'poems':
+
+    poems --store data --output data/poems.pickle --cache data/analysis.db --workers 4
+
+The notebooks can then load the analyzed poems with pd.read_pickle('data/poems.pickle').
+"""
+import argparse
+import sys
+from pathlib import Path
+from src import instrumentation
+from src.comment_store import PickleCommentStore, SQLiteCommentStore
+from src.meter import known_meters_inv
+from src.pipeline import run_pipeline
+from src.reddit_user_comment_reader import RedditUserCommentReader
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+
+    instrumentation.reset()
+    instrumentation.enable()
+    store = _get_store(args.store)
+    with instrumentation.stage("read"):
+        if args.no_crawl:
+            df_comments = store.load()
+        else:
+            data_dir = args.store if isinstance(store, PickleCommentStore) else str(Path(args.store).parent)
+            reader = RedditUserCommentReader(
+                args.author,
+                data_dir,
+                store=store,
+                max_in_flight=args.max_in_flight,
+                requests_per_second=args.requests_per_second,
+            )
+            df_comments = reader.read()
+    if df_comments.empty:
+        print(f"No comments in the store '{args.store}', nothing to analyze.", file=sys.stderr)
+        instrumentation.disable()
+        return 1
+
+    df = run_pipeline(
+        df_comments,
+        known_meters_inv,
+        cache_path=args.cache,
+        workers=args.workers,
+        chunksize=args.chunksize,
+        tie_break=args.tie_break,
+        near_rhyme_distance=args.near_rhyme_distance,
+        index_dir=args.index_dir,
+    )
+    with instrumentation.stage("write", rows=len(df)):
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        df.to_pickle(args.output)
+
+    print(instrumentation.summary().to_string())
+    if args.timings:
+        instrumentation.to_json(args.timings)
+    instrumentation.disable()
+    return 0
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="poems", description="Read, parse and analyze the meter and rhyme of the poems of a Reddit user."
+    )
+    parser.add_argument("--author", default="poem_for_your_sprog", help="The Reddit user to read the comments of.")
+    parser.add_argument(
+        "--store",
+        default="data",
+        help="Comment store: a directory for pickle files, or a path ending in .db or .sqlite for SQLite.",
+    )
+    parser.add_argument("--output", required=True, help="Path of the pickle file to write the analyzed poems to.")
+    parser.add_argument("--cache", help="Optional path of the SQLite analysis cache, to only analyze new poems.")
+    parser.add_argument("--timings", help="Optional path of a JSON file to write the timings per stage to.")
+    parser.add_argument("--no-crawl", action="store_true", help="Only analyze the comments that are already stored.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of processes for the meter analysis.")
+    parser.add_argument("--chunksize", type=int, default=500, help="Number of poems per task of a worker process.")
+    parser.add_argument("--max-in-flight", type=int, default=4, help="Maximum number of batches read at once.")
+    parser.add_argument("--requests-per-second", type=float, default=2, help="Maximum requests per second per API.")
+    parser.add_argument("--tie-break", choices=["lexical", "family"], default="lexical", help="See get_known_meter.")
+    parser.add_argument("--near-rhyme-distance", type=int, help="See get_rhyme_scheme.")
+    parser.add_argument("--index-dir", help="Optional directory with a compiled CMUdict index, see src.cmudict_index.")
+    return parser.parse_args(argv)
+
+
+def _get_store(path):
+    if Path(path).suffix in (".db", ".sqlite"):
+        return SQLiteCommentStore(path)
+    return PickleCommentStore(path)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
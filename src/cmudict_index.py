@@ -0,0 +1,186 @@
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+from src.lazy import lazy_import
+
+np = lazy_import("numpy")
+pronouncing = lazy_import("pronouncing")
+
+_active_index = None
+
+
+class CMUDictIndex:
+    """
+    A compact, array-backed version of the CMU pronouncing dictionary, with only the information used in src.meter
+    and src.rhyme: the stress pattern and the rhyming part of every pronunciation.
+
+    The index is compiled once with CMUDictIndex.build(index_dir) and stored as a directory of .npy files:
+
+    words.npy: Sorted table with all words in the dictionary.
+    word_offsets.npy: Pronunciations of words[i] are rows word_offsets[i]:word_offsets[i+1] in the arrays below.
+    stress_bits.npy: Stress pattern per pronunciation, packed in an integer. 2's are stored as 1's.
+    stress_lengths.npy: Number of syllables per pronunciation.
+    rhyme_ids.npy: Id of the rhyming part per pronunciation, an index to rhyming_parts.npy.
+    rhyming_parts.npy: Sorted table with all rhyming parts, e.g. 'EY1'.
+    rhyme_members.npy: Word indices, sorted by rhyme id. Words with rhyme id r are
+        rhyme_members[rhyme_offsets[r]:rhyme_offsets[r+1]].
+    rhyme_offsets.npy: See rhyme_members.npy.
+
+    CMUDictIndex.load(index_dir) memory-maps these files, so processes that load the same index share its pages
+    through the OS cache instead of each building their own dictionary.
+    """
+
+    _arrays = [
+        "words",
+        "word_offsets",
+        "stress_bits",
+        "stress_lengths",
+        "rhyme_ids",
+        "rhyming_parts",
+        "rhyme_members",
+        "rhyme_offsets",
+    ]
+
+    def __init__(self, **arrays):
+        for name in self._arrays:
+            setattr(self, name, arrays[name])
+        self._max_word_length = self.words.dtype.itemsize
+
+    @classmethod
+    def build(cls, index_dir):
+        """
+        Compile the CMU pronouncing dictionary as shipped with the pronouncing package into an index in 'index_dir'.
+        """
+        pronouncing.init_cmu()
+        phones_per_word = {}
+        for word, phones in pronouncing.pronunciations:
+            phones_per_word.setdefault(word, []).append(phones)
+
+        words = sorted(phones_per_word)
+        word_offsets = np.cumsum([0] + [len(phones_per_word[word]) for word in words])
+        phones_per_row = [phones for word in words for phones in phones_per_word[word]]
+
+        stresses_per_row = [pronouncing.stresses(phones) for phones in phones_per_row]
+        if max(len(stresses) for stresses in stresses_per_row) > 32:
+            raise ValueError("Stress patterns of more than 32 syllables can not be packed.")
+        stress_bits = [int(stresses.replace("2", "1"), 2) if stresses else 0 for stresses in stresses_per_row]
+        stress_lengths = [len(stresses) for stresses in stresses_per_row]
+
+        rhyming_part_per_row = [pronouncing.rhyming_part(phones) for phones in phones_per_row]
+        rhyming_parts = sorted(set(rhyming_part_per_row))
+        rhyme_id_lookup = {rhyming_part: i for i, rhyming_part in enumerate(rhyming_parts)}
+        rhyme_ids = np.array([rhyme_id_lookup[x] for x in rhyming_part_per_row], dtype=np.int32)
+
+        row_word = np.repeat(np.arange(len(words), dtype=np.int32), np.diff(word_offsets))
+        rows = np.argsort(rhyme_ids, kind="stable")
+        rhyme_offsets = np.searchsorted(rhyme_ids[rows], np.arange(len(rhyming_parts) + 1))
+
+        arrays = dict(
+            words=np.array([word.encode("utf-8") for word in words]),
+            word_offsets=word_offsets.astype(np.int32),
+            stress_bits=np.array(stress_bits, dtype=np.uint32),
+            stress_lengths=np.array(stress_lengths, dtype=np.uint8),
+            rhyme_ids=rhyme_ids,
+            rhyming_parts=np.array([x.encode("utf-8") for x in rhyming_parts]),
+            rhyme_members=row_word[rows],
+            rhyme_offsets=rhyme_offsets.astype(np.int32),
+        )
+        Path(index_dir).mkdir(parents=True, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(Path(index_dir) / f"{name}.npy", array)
+        return cls(**arrays)
+
+    @classmethod
+    def load(cls, index_dir):
+        return cls(**{name: np.load(Path(index_dir) / f"{name}.npy", mmap_mode="r") for name in cls._arrays})
+
+    def stresses_for_word(self, word):
+        """
+        Returns the stress patterns for all pronunciations of a word, with 2's replaced by 1's.
+
+        Example:
+
+        > index.stresses_for_word('permit')
+        > ['01', '11']
+        """
+        rows = self._rows(word.lower())
+        return [
+            format(int(bits), f"0{length}b") if length else ""
+            for bits, length in zip(self.stress_bits[rows], self.stress_lengths[rows])
+        ]
+
+    def rhyming_parts_for_word(self, word):
+        """
+        Returns the rhyming parts for all pronunciations of a word, like pronouncing.rhyming_part.
+        """
+        return [self.rhyming_parts[i].decode("utf-8") for i in self.rhyme_ids[self._rows(word.lower())]]
+
+    def rhymes(self, word):
+        """
+        Returns the words that rhyme with the first pronunciation of a word, like pronouncing.rhymes.
+        """
+        rhyme_ids = self.rhyme_ids[self._rows(word.lower())]
+        return self._words_with_rhyme_ids(rhyme_ids[:1], exclude=word)
+
+    def rhymes_all(self, word):
+        """
+        Returns the words that rhyme with any of the pronunciations of a word.
+        """
+        return self._words_with_rhyme_ids(self.rhyme_ids[self._rows(word.lower())], exclude=word)
+
+    def _rows(self, word):
+        encoded = word.encode("utf-8")
+        if len(encoded) > self._max_word_length:
+            return slice(0, 0)
+        i = np.searchsorted(self.words, encoded)
+        if i == len(self.words) or self.words[i] != encoded:
+            return slice(0, 0)
+        return slice(self.word_offsets[i], self.word_offsets[i + 1])
+
+    def _words_with_rhyme_ids(self, rhyme_ids, exclude):
+        words = [
+            self.words[i].decode("utf-8")
+            for rhyme_id in rhyme_ids
+            for i in self.rhyme_members[self.rhyme_offsets[rhyme_id] : self.rhyme_offsets[rhyme_id + 1]]
+        ]
+        return [w for w in words if w != exclude]
+
+
+def use_index(index_dir):
+    """
+    Load the index in 'index_dir' and use it instead of the pronouncing package for all pronunciation lookups
+    in src.meter and src.rhyme. Pass None to go back to the pronouncing package.
+    """
+    global _active_index
+    _active_index = CMUDictIndex.load(index_dir) if index_dir is not None else None
+    return _active_index
+
+
+def get_active_index():
+    return _active_index
+
+
+@contextmanager
+def using_index(index_dir):
+    """
+    Context manager that uses the index in 'index_dir' like use_index, and goes back to the index that was used
+    before on exit. With index_dir None, the index that is used does not change.
+
+    Example:
+
+    > with using_index('data/cmudict_index'):
+    >     get_rhyme_scheme(['time', 'line'])
+    """
+    global _active_index
+    previous_index = _active_index
+    if index_dir is not None:
+        use_index(index_dir)
+    try:
+        yield _active_index
+    finally:
+        _active_index = previous_index
+
+
+if __name__ == "__main__":
+    # Build step: python -m src.cmudict_index <index_dir>
+    CMUDictIndex.build(sys.argv[1])
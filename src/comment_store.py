@@ -0,0 +1,163 @@
+import glob
+import json
+import re
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+from src.lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+
+class PickleCommentStore:
+    """
+    Stores every batch of comments as a file df_<min created_utc>_<max created_utc>.pickle in data_dir. The
+    high-water mark, i.e. the created_utc of the latest stored comment, is kept in high_water_mark.json, so it
+    does not have to be determined from the names of all files on every batch.
+
+    data_dir: The directory with the pickle files.
+    """
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        Path(self.data_dir).mkdir(parents=True, exist_ok=True)
+        self._metadata_file = Path(self.data_dir) / "high_water_mark.json"
+
+    def append(self, df):
+        df.to_pickle(f"{self.data_dir}/df_{int(df.created_utc.min())}_{int(df.created_utc.max())}.pickle")
+        high_water_mark = max(int(df.created_utc.max()), self.get_high_water_mark() or 0)
+        self._metadata_file.write_text(json.dumps({"high_water_mark": high_water_mark}))
+
+    def get_high_water_mark(self):
+        if self._metadata_file.exists():
+            return json.loads(self._metadata_file.read_text())["high_water_mark"]
+        # Directory written before the high-water mark was stored, determine it once from the file names.
+        pickle_files = self._get_pickle_files()
+        if len(pickle_files) < 1:
+            return None
+        high_water_mark = max(int(re.findall(r"(\d+)\.pickle", x)[0]) for x in pickle_files)
+        self._metadata_file.write_text(json.dumps({"high_water_mark": high_water_mark}))
+        return high_water_mark
+
+    def load(self, columns=None):
+        """
+        Returns all stored comments. With columns, only these columns are returned.
+        """
+        batches = [df if columns is None else df[columns] for df in self.iter_batches()]
+        return pd.concat(batches) if batches else pd.DataFrame(columns=columns)
+
+    def iter_batches(self):
+        """
+        Yields the stored batches in chronological order.
+        """
+        for pickle_file in self._get_pickle_files():
+            yield pd.read_pickle(pickle_file)
+
+    def compact(self):
+        """
+        Merge all batch files into a single file.
+        """
+        pickle_files = self._get_pickle_files()
+        if len(pickle_files) <= 1:
+            return
+        df = pd.concat([pd.read_pickle(x) for x in pickle_files]).sort_values("created_utc", kind="stable")
+        # Comments can be stored twice if an earlier compact() was interrupted, see below.
+        df = df.drop_duplicates("id", keep="last")
+        compacted_file = Path(f"{self.data_dir}/df_{int(df.created_utc.min())}_{int(df.created_utc.max())}.pickle")
+        df.to_pickle(f"{compacted_file}.tmp")
+        # Move the compacted file into place before removing the batch files, so an interruption in between leaves
+        # comments that are stored twice, instead of a store without any batch files.
+        Path(f"{compacted_file}.tmp").replace(compacted_file)
+        for pickle_file in pickle_files:
+            if Path(pickle_file) != compacted_file:
+                Path(pickle_file).unlink()
+
+    def _get_pickle_files(self):
+        pickle_files = glob.glob(f"{self.data_dir}/*.pickle")
+        return sorted(pickle_files, key=lambda x: int(re.findall(r"(\d+)_\d+\.pickle", x)[0]))
+
+
+class SQLiteCommentStore:
+    """
+    Stores all comments in a single SQLite table, with one row per comment id, an index on created_utc and the
+    comment itself as JSON. Appending a batch is a single transaction, the high-water mark is kept in a metadata
+    table, and load() only extracts the requested columns from the JSON.
+
+    An existing directory of pickle files can be converted with
+    SQLiteCommentStore(path).append(PickleCommentStore(data_dir).load()).
+
+    path: The path of the SQLite database file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS comments (id TEXT PRIMARY KEY, created_utc REAL NOT NULL, data TEXT NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS comments_created_utc ON comments (created_utc)")
+            connection.execute("CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value)")
+
+    def append(self, df):
+        """
+        Add a batch of comments. Comments with an id that is already stored are replaced.
+        """
+        rows = zip(df["id"], df["created_utc"].astype(float), df.to_json(orient="records", lines=True).splitlines())
+        with self._connect() as connection:
+            connection.executemany("INSERT OR REPLACE INTO comments (id, created_utc, data) VALUES (?, ?, ?)", rows)
+            connection.execute(
+                "INSERT OR REPLACE INTO metadata (key, value) "
+                "SELECT 'high_water_mark', CAST(MAX(created_utc) AS INTEGER) FROM comments"
+            )
+
+    def get_high_water_mark(self):
+        with self._connect() as connection:
+            row = connection.execute("SELECT value FROM metadata WHERE key = 'high_water_mark'").fetchone()
+        return row[0] if row else None
+
+    def load(self, columns=None):
+        """
+        Returns all stored comments in chronological order. With columns, only these columns are returned.
+        """
+        batches = list(self.iter_batches(columns=columns))
+        return pd.concat(batches, ignore_index=True) if batches else pd.DataFrame(columns=columns)
+
+    def iter_batches(self, batch_size=10000, columns=None):
+        """
+        Yields the stored comments in chronological order, in DataFrames of at most batch_size comments.
+        """
+        if columns is None:
+            query, params = "SELECT data FROM comments ORDER BY created_utc", []
+        else:
+            # json_object keeps nested values of the extracted columns as JSON, so each row is parsed only once.
+            arguments = ", ".join(["?, json_extract(data, ?)"] * len(columns))
+            query = f"SELECT json_object({arguments}) FROM comments ORDER BY created_utc"
+            params = [x for column in columns for x in (column, f'$."{column}"')]
+        with self._connect() as connection:
+            cursor = connection.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield pd.DataFrame([json.loads(row[0]) for row in rows], columns=columns)
+
+    def compact(self):
+        """
+        Rebuild the database file without the free pages left behind by replaced comments.
+        """
+        with self._connect() as connection:
+            connection.execute("VACUUM")
+            connection.execute("ANALYZE")
+
+    @contextmanager
+    def _connect(self):
+        """
+        Opens a connection that commits on success, rolls back on an exception and is always closed.
+        """
+        connection = sqlite3.connect(self.path)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
@@ -1,43 +1,129 @@
 import datetime as dt
 import re
+import time
+from src import instrumentation
+from src.lazy import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
 
 
 class DataFrameParser:
     def __init__(self):
         pass
 
-    def parse(self, df):
-        df = self._remove_deleted_comments(df)
-        df = self._clean_comments(df)
-        df = self._add_date_and_datetime(df)
-        df = self._parse_awards(df)
-        df = self._add_line_and_lenght_statistics(df)
-        df = self._determine_comment_or_poem(df)
+    def parse(self, df, copy=True):
+        """
+        Parse a DataFrame with comments as returned by RedditUserCommentReader.
+
+        copy: If False, df may be modified in place; only use this if df is not used elsewhere. Then no copy of df
+            is made at all if it has no deleted comments.
+        """
+        n_comments = len(df)
+        with instrumentation.stage("parse.remove_deleted_comments", rows=n_comments):
+            df = self._remove_deleted_comments(df, copy)
+        instrumentation.count("parse.remove_deleted_comments", "deleted_comments", n_comments - len(df))
+        with instrumentation.stage("parse.clean_comments", rows=len(df)):
+            df = self._clean_comments(df)
+        with instrumentation.stage("parse.add_date_and_datetime", rows=len(df)):
+            df = self._add_date_and_datetime(df)
+        with instrumentation.stage("parse.parse_awards", rows=len(df)):
+            df = self._parse_awards(df)
+        with instrumentation.stage("parse.add_line_and_length_statistics", rows=len(df)):
+            df = self._add_line_and_lenght_statistics(df)
+        with instrumentation.stage("parse.determine_comment_or_poem", rows=len(df)):
+            df = self._determine_comment_or_poem(df)
         return df
 
+    def parse_iter(self, chunks, drop_columns=None):
+        """
+        Parse an iterable of DataFrames, e.g. one per batch from RedditUserCommentReader.read_iter(), and yield the
+        parsed DataFrames one at a time. Only one chunk needs to be in memory at once, so this also works for archives
+        that are larger than memory. The chunks are modified in place.
+
+        drop_columns: Optional list of columns to drop from the parsed chunks, such as the raw columns 'body' and
+            'all_awardings' that are no longer needed after parsing.
+        """
+        for chunk in chunks:
+            df = self.parse(chunk, copy=False)
+            if drop_columns:
+                df.drop(columns=[x for x in drop_columns if x in df.columns], inplace=True)
+            yield df
+
     @staticmethod
-    def _remove_deleted_comments(df):
-        return df[df["author"] != "[deleted]"]
+    def _remove_deleted_comments(df, copy=True):
+        is_deleted = (df["author"] == "[deleted]").to_numpy()
+        if not copy and not is_deleted.any():
+            return df
+        # take() returns a new DataFrame, not a view, so adding columns to it does not raise a SettingWithCopyWarning.
+        return df.take(np.flatnonzero(~is_deleted))
 
     def _clean_comments(self, df):
         df["poem"] = df["body"].apply(self._clean_comment)
         return df
 
-    @staticmethod
-    def _add_date_and_datetime(df):
-        df["datetime"] = df["created_utc"].apply(dt.datetime.fromtimestamp)
+    @classmethod
+    def _add_date_and_datetime(cls, df):
+        seconds = df["created_utc"].to_numpy(dtype=float)
+        df["datetime"] = pd.to_datetime(seconds + cls._local_utc_offsets(seconds), unit="s")
         df["date"] = df["datetime"].dt.date
         return df
 
+    @staticmethod
+    def _local_utc_offsets(seconds):
+        """
+        Returns the offset of local time to UTC in seconds for each timestamp, so that adding it gives the same
+        local time as dt.datetime.fromtimestamp. The offset is looked up once per day, and only on days where it
+        changes, the exact second of the change is looked up with a binary search.
+        """
+        if len(seconds) == 0:
+            return np.zeros(0)
+
+        def get_offset(timestamp):
+            return time.localtime(timestamp).tm_gmtoff
+
+        first_day = int(seconds.min() // 86400) * 86400
+        days = range(first_day, int(seconds.max()) + 86400, 86400)
+        transitions, offsets = [first_day], [get_offset(first_day)]
+        for day in days[1:]:
+            offset = get_offset(day)
+            if offset != offsets[-1]:
+                low, high = day - 86400, day
+                while high - low > 1:
+                    middle = (low + high) // 2
+                    if get_offset(middle) == offsets[-1]:
+                        low = middle
+                    else:
+                        high = middle
+                transitions.append(high)
+                offsets.append(offset)
+        return np.array(offsets, dtype=float)[np.searchsorted(transitions, seconds, side="right") - 1]
+
     @staticmethod
     def _parse_awards(df):
         df["awards_dict"] = df["all_awardings"].apply(lambda x: {y["name"]: y["count"] for y in x})
         df["awards_simple"] = df["all_awardings"].apply(lambda x: [y["name"] + ": " + str(y["count"]) for y in x])
         return df
 
+    @staticmethod
+    def get_awards_table(df):
+        """
+        Returns a normalized table with one row per award per comment, with the columns 'comment_index' (the index
+        of the comment in df), 'name' and 'count'. Useful for columnar analyses of awards, e.g.
+        get_awards_table(df).groupby('name')['count'].sum().
+        """
+        awards = df["all_awardings"].explode().dropna()
+        return pd.DataFrame(
+            {
+                "comment_index": awards.index,
+                "name": [award["name"] for award in awards],
+                "count": [award["count"] for award in awards],
+            }
+        )
+
     @staticmethod
     def _add_line_and_lenght_statistics(df):
-        df["number_of_lines"] = df["poem"].apply(lambda x: 1 + sum(1 for _ in re.finditer(r">", x)))
+        df["number_of_lines"] = 1 + df["poem"].str.count(">")
         df["comment_length"] = df["poem"].str.len()
         df["average_line_length"] = df["comment_length"] / (df["number_of_lines"])
         return df
@@ -46,23 +132,33 @@ class DataFrameParser:
     def _determine_comment_or_poem(df):
         df["type"] = "poem"
         df.loc[df["date"] == dt.date(2015, 6, 23), "type"] = "comment"  # AMA
-        df.loc[df["poem"].apply(len) < 1, "type"] = "comment"
+        df.loc[df["comment_length"] < 1, "type"] = "comment"
         df.loc[df["number_of_lines"] <= 1, "type"] = "comment"
         df.loc[df["average_line_length"] >= 55, "type"] = "comment"
         return df
 
-    @staticmethod
-    def _clean_comment(comment):
+    _quoted_text = re.compile(r"&gt.+\n")
+    _url = re.compile(r"(https?://\S+)")
+    _subreddit_link = re.compile(r"(/r/\S+)")
+    _other_characters = re.compile(r"[^A-Za-z0-9 >,\.!?\'-]")
+    # After removing _other_characters, ' ' is the only white space left and '"' is gone.
+    _space_before_interpunction = re.compile(r" ([?.!,](?: |$))")
+    _multi_space = re.compile(r" {2,}")
+
+    @classmethod
+    def _clean_comment(cls, comment):
         comment = comment.lower()  # Remove quoted text, often at start of a comment.
-        comment = re.sub(r"&gt.+\n", "", comment)
-        comment = re.sub(r"(https?://\S+)", r" ", comment)  # Remove URL's
-        comment = re.sub(r"\n", ">", comment)  # Replace \n with a special character to denote linebreaks
-        comment = re.sub(r"(/r/\S+)", r" ", comment)  # remove links to specific subreddits
-        comment = re.sub(r"[^A-Za-z0-9 >,\.!?\'-]", " ", comment)  # Keep only these characters
-        comment = re.sub(r"amp nbsp", " ", comment)
-        comment = re.sub(r'\s([?.!",](?:\s|$))', r"\1", comment)  # remove white space between text and interpunction
-        comment = re.sub("\s*([>])\s*", r"\1", comment)  # remove space between line breaks
-        comment = re.sub(" +", " ", comment)  # Remove multi-white space
-        comment = re.sub(">+", ">", comment)  # Remove multi-linebreaks
+        comment = cls._quoted_text.sub("", comment)
+        comment = cls._url.sub(" ", comment)  # Remove URL's
+        comment = comment.replace("\n", ">")  # Replace \n with a special character to denote linebreaks
+        comment = cls._subreddit_link.sub(" ", comment)  # remove links to specific subreddits
+        comment = cls._other_characters.sub(" ", comment)  # Keep only these characters
+        comment = comment.replace("amp nbsp", " ")
+        # remove white space between text and interpunction
+        comment = cls._space_before_interpunction.sub(r"\1", comment)
+        lines = (line.strip(" ") for line in comment.split(">"))
+        comment = ">".join([line for line in lines if line])  # remove space between line breaks and multi-linebreaks
+        if "  " in comment:
+            comment = cls._multi_space.sub(" ", comment)  # Remove multi-white space
         comment = comment.strip(" >")
         return comment
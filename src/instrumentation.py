@@ -0,0 +1,112 @@
+import json
+import time
+from contextlib import nullcontext
+from src.lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+# Instrumentation is opt-in. While disabled, stage() returns a shared no-op context manager and count() returns
+# immediately, so the hooks in src.data_frame_parser, src.meter and src.rhyme cost next to nothing.
+enabled = False
+_records = {}
+_disabled_stage = nullcontext()
+
+
+def enable():
+    """
+    Start recording the time, rows and counters of the instrumented stages.
+
+    Example:
+
+    > instrumentation.enable()
+    > df = DataFrameParser().parse(df)
+    > instrumentation.summary()
+    """
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    """
+    Remove all recorded stages.
+    """
+    _records.clear()
+
+
+def stage(name, rows=None):
+    """
+    Context manager that adds the wall time of its body to the stage 'name', and 'rows' to its number of processed
+    rows. A stage can be entered multiple times; the times, rows and counters are summed.
+    """
+    if not enabled:
+        return _disabled_stage
+    return _Stage(name, rows)
+
+
+def count(name, counter, n=1):
+    """
+    Add n to 'counter' of the stage 'name', e.g. count('meter.scansion', 'unknown_words', 3).
+    """
+    if not enabled:
+        return
+    counters = _get_record(name)["counters"]
+    counters[counter] = counters.get(counter, 0) + n
+
+
+def summary():
+    """
+    Returns a DataFrame with a row per stage, in the order in which they were first recorded, with the number of
+    calls, the total time in seconds, the rows processed, the rows per second and a column per counter.
+    """
+    rows = []
+    for name, record in _records.items():
+        seconds, n_rows = record["seconds"], record["rows"]
+        row = {
+            "stage": name,
+            "calls": record["calls"],
+            "seconds": seconds,
+            "rows": n_rows,
+            "rows_per_second": n_rows / seconds if n_rows and seconds else None,
+        }
+        rows.append({**row, **record["counters"]})
+    return pd.DataFrame(rows).set_index("stage") if rows else pd.DataFrame()
+
+
+def to_json(path=None):
+    """
+    Returns the recorded stages as a JSON string, and writes it to 'path' if given.
+    """
+    result = json.dumps(_records, indent=2)
+    if path is not None:
+        with open(path, "w") as f:
+            f.write(result)
+    return result
+
+
+def _get_record(name):
+    record = _records.get(name)
+    if record is None:
+        record = _records[name] = {"calls": 0, "seconds": 0.0, "rows": 0, "counters": {}}
+    return record
+
+
+class _Stage:
+    def __init__(self, name, rows):
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record = _get_record(self.name)
+        record["calls"] += 1
+        record["seconds"] += time.perf_counter() - self.start
+        record["rows"] += self.rows or 0
+        return False
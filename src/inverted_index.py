@@ -0,0 +1,228 @@
+import pickle
+import re
+from collections import Counter
+from src.lazy import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+_token = re.compile(r"\w+")
+# Phrase queries combine the number of a document and a position in it into one integer, number << 32 | position.
+_position_bits = 32
+
+
+class InvertedIndex:
+    """
+    Token-level inverted index over the 'poem' column as returned by DataFrameParser, to find the poems that contain
+    a word or a phrase, and to count words, without scanning the whole corpus for every query. Tokens are the
+    sequences of word characters, as with RegexpTokenizer(r'\\w+'), so "i'd" is indexed as 'i' and 'd'. For every
+    token the index keeps the positions at which it occurs in each poem. Positions skip one at every line break
+    ('>'), so a phrase never matches across two lines. Phrase queries use a sorted array per token with its
+    positions in all poems, which is built on first use and rebuilt after poems with the token are added or removed.
+
+    Poems and queries are lowercased. Unlike 'timmy' in poem, a query only matches whole words: 'timmy' does not
+    match 'timmys'.
+
+    Example:
+
+    > index = InvertedIndex()
+    > index.add(df['poem'])
+    > about_timmy = index.search('timmy')
+    > timmy_died = index.search('timmy fucking died')
+    > df_timmy_not_dying = df[index.mask('timmy', df.index) & ~index.mask('timmy fucking died', df.index)]
+    > index.most_common(80, exclude=stop_words)
+    """
+
+    def __init__(self):
+        # term -> {document key: positions of the term in the document}
+        self.postings = {}
+        # term -> number of occurrences in all documents
+        self.frequencies = Counter()
+        # document key -> the unique terms in the document, to be able to remove it again.
+        self._terms_per_document = {}
+        # document key -> number of the document in the position arrays, and the reverse.
+        self._document_numbers = {}
+        self._document_keys = []
+        # term -> sorted array with the positions of the term in all documents, see _get_position_array.
+        self._position_arrays = {}
+
+    def __len__(self):
+        return len(self._terms_per_document)
+
+    def __contains__(self, key):
+        return key in self._terms_per_document
+
+    def add(self, poems):
+        """
+        Add the poems in the Series 'poems' to the index, with the index of the Series as the document keys. Poems
+        with a key that is already in the index replace the earlier version, so new comments can be added as they
+        arrive. Missing poems are indexed as empty.
+        """
+        for key, poem in poems.items():
+            if key in self._terms_per_document:
+                self.remove(key)
+            positions_per_term = _get_positions_per_term(poem if isinstance(poem, str) else "")
+            for term, positions in positions_per_term.items():
+                postings = self.postings.get(term)
+                if postings is None:
+                    postings = self.postings[term] = {}
+                postings[key] = positions
+                self.frequencies[term] += len(positions)
+                self._position_arrays.pop(term, None)
+            self._terms_per_document[key] = tuple(positions_per_term)
+            if key not in self._document_numbers:
+                self._document_numbers[key] = len(self._document_keys)
+                self._document_keys.append(key)
+
+    def remove(self, key):
+        """
+        Remove the document with key 'key' from the index.
+        """
+        for term in self._terms_per_document.pop(key):
+            postings = self.postings[term]
+            self.frequencies[term] -= len(postings.pop(key))
+            self._position_arrays.pop(term, None)
+            if not postings:
+                del self.postings[term]
+                del self.frequencies[term]
+
+    def search(self, query):
+        """
+        Returns the set of keys of the documents that contain 'query', a single word or a phrase of consecutive
+        words on the same line.
+        """
+        tokens = _tokenize_query(query)
+        if len(tokens) == 1:
+            return set(self.postings.get(tokens[0], ()))
+        return set(self._count_phrase(tokens))
+
+    def mask(self, query, index):
+        """
+        Returns a boolean Series with the index 'index', that is True for the keys of the documents that contain
+        'query'. Useful to select rows from the DataFrame that the poems were added from.
+        """
+        return pd.Series(index.isin(self.search(query)), index=index)
+
+    def frequency(self, query):
+        """
+        Returns the number of times 'query', a word or a phrase, occurs in all documents.
+        """
+        tokens = _tokenize_query(query)
+        if len(tokens) == 1:
+            return self.frequencies.get(tokens[0], 0)
+        return sum(self._count_phrase(tokens).values())
+
+    def document_frequency(self, query):
+        """
+        Returns the number of documents that contain 'query', a word or a phrase.
+        """
+        tokens = _tokenize_query(query)
+        if len(tokens) == 1:
+            return len(self.postings.get(tokens[0], ()))
+        return len(self._count_phrase(tokens))
+
+    def most_common(self, n=None, exclude=()):
+        """
+        Returns a list with the n most common terms and their number of occurrences, from most to least common,
+        leaving out the terms in 'exclude', e.g. stop words. With n=None, all terms are returned.
+        """
+        exclude = set(exclude)
+        if not exclude:
+            return self.frequencies.most_common(n)
+        terms = ((term, count) for term, count in self.frequencies.most_common() if term not in exclude)
+        return list(terms) if n is None else [x for _, x in zip(range(n), terms)]
+
+    def save(self, path):
+        """
+        Write the index to 'path', so it can be loaded with InvertedIndex.load(path) and updated with new poems.
+        """
+        with open(path, "wb") as f:
+            pickle.dump(
+                (
+                    self.postings,
+                    self.frequencies,
+                    self._terms_per_document,
+                    self._document_numbers,
+                    self._document_keys,
+                ),
+                f,
+            )
+
+    @classmethod
+    def load(cls, path):
+        index = cls()
+        with open(path, "rb") as f:
+            (
+                index.postings,
+                index.frequencies,
+                index._terms_per_document,
+                index._document_numbers,
+                index._document_keys,
+            ) = pickle.load(f)
+        return index
+
+    def _count_phrase(self, tokens):
+        """
+        Returns a dict with the keys of the documents that contain the phrase 'tokens' and the number of times it
+        occurs in them.
+        """
+        if not all(token in self.postings for token in tokens):
+            return {}
+        arrays = [self._get_position_array(token) for token in tokens]
+        # Take the positions at which the phrase would start according to the least common token, and keep those at
+        # which every other token occurs at its offset in the phrase.
+        rarest = min(range(len(tokens)), key=lambda i: len(arrays[i]))
+        starts = arrays[rarest] - rarest
+        for offset, array in enumerate(arrays):
+            if offset != rarest:
+                starts = starts[_isin_sorted(starts + offset, array)]
+        numbers, counts = np.unique(starts >> _position_bits, return_counts=True)
+        return {self._document_keys[number]: count for number, count in zip(numbers.tolist(), counts.tolist())}
+
+    def _get_position_array(self, term):
+        array = self._position_arrays.get(term)
+        if array is None:
+            array = np.fromiter(
+                (
+                    self._document_numbers[key] << _position_bits | position
+                    for key, positions in self.postings[term].items()
+                    for position in positions
+                ),
+                dtype=np.int64,
+                count=self.frequencies[term],
+            )
+            array.sort()
+            self._position_arrays[term] = array
+        return array
+
+
+def _isin_sorted(values, sorted_array):
+    """
+    Returns a boolean array that is True for the values that are in 'sorted_array'.
+    """
+    i = np.searchsorted(sorted_array, values)
+    i[i == len(sorted_array)] = 0
+    return sorted_array[i] == values
+
+
+def _get_positions_per_term(poem):
+    positions_per_term = {}
+    position = 0
+    for line in poem.lower().split(">"):
+        for token in _token.findall(line):
+            positions = positions_per_term.get(token)
+            if positions is None:
+                positions_per_term[token] = [position]
+            else:
+                positions.append(position)
+            position += 1
+        # Skip a position at every line break, so phrases do not match across lines.
+        position += 1
+    return positions_per_term
+
+
+def _tokenize_query(query):
+    tokens = _token.findall(query.lower())
+    if not tokens:
+        raise ValueError(f"Query '{query}' does not contain any words.")
+    return tokens
@@ -0,0 +1,31 @@
+import importlib
+
+
+def lazy_import(name):
+    """
+    Returns a stand-in for the module 'name' that only imports it on first attribute access. This keeps importing the
+    src modules fast for short-lived processes, such as the CLI and worker processes, that do not use all their
+    dependencies.
+
+    Example:
+
+    > np = lazy_import('numpy')  # numpy is not imported yet
+    > np.zeros(3)  # numpy is imported here
+    """
+    return _LazyModule(name)
+
+
+class _LazyModule:
+    def __init__(self, name):
+        self._lazy_module_name = name
+        self._lazy_module = None
+
+    def __getattr__(self, attribute):
+        # Forward every lookup to the module instead of copying its attributes, since modules such as pronouncing
+        # replace their globals after import, e.g. pronouncing.lookup in init_cmu().
+        if self._lazy_module is None:
+            self._lazy_module = importlib.import_module(self._lazy_module_name)
+        return getattr(self._lazy_module, attribute)
+
+    def __repr__(self):
+        return f"<lazy module '{self._lazy_module_name}'>"
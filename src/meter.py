@@ -1,7 +1,16 @@
-import numpy as np
+import heapq
 import re
-import pronouncing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from string import punctuation
+from src import instrumentation
+from src.cache import LRUCache
+from src.cmudict_index import get_active_index, use_index, using_index
+from src.lazy import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+pronouncing = lazy_import("pronouncing")
 
 
 def get_word_scansion(word):
@@ -16,19 +25,34 @@ def get_word_scansion(word):
     word = word.strip(punctuation)
     if word == "":
         return ""
-    pronounciation = pronouncing.phones_for_word(word)
-    if pronounciation:
-        stresses = pronouncing.stresses(pronounciation[0])
-    else:
+    stresses = _get_stresses(word)
+    if stresses is None:
         word = re.sub("'.+", "", word)
-        pronounciation = pronouncing.phones_for_word(word)
-        if pronounciation:
-            stresses = pronouncing.stresses(pronounciation[0])
-        else:
+        stresses = _get_stresses(word)
+        if stresses is None:
             stresses = "?"
     return re.sub("2", "1", stresses)
 
 
+def _get_stresses(word):
+    """
+    Returns the stresses of the first pronunciation of a word, or None if the word is not in the dictionary.
+    Uses the compiled CMUdict index if one is loaded with src.cmudict_index.use_index().
+    """
+    index = get_active_index()
+    if index is not None:
+        stresses = index.stresses_for_word(word)
+        return stresses[0] if stresses else None
+    pronounciation = pronouncing.phones_for_word(word)
+    return pronouncing.stresses(pronounciation[0]) if pronounciation else None
+
+
+# Cache around get_word_scansion, shared by get_line_scansion and the notebooks. The same few thousand words make
+# up nearly all tokens in the corpus, so most lookups are hits. Use word_scansion_cache.warm(words) to pre-warm it,
+# and word_scansion_cache.save(path) / word_scansion_cache.load(path) to skip the cold start in a fresh process.
+word_scansion_cache = LRUCache(get_word_scansion, maxsize=100000)
+
+
 def get_line_scansion(line):
     """
     Get the scansion per line, as a string of 0's and 1's.
@@ -39,7 +63,20 @@ def get_line_scansion(line):
     > '11100'
 
     """
-    return "".join([get_word_scansion(word) for word in line.split(" ")])
+    return "".join([word_scansion_cache(word) for word in line.split(" ")])
+
+
+def get_line_syllable_text(line):
+    """
+    Get the text for each syllable of the scansion of a line, to label the plots of src.plotly.plot_meters. The
+    first syllable of each word is labeled with the word, the others are left empty.
+
+    Example:
+
+    > get_line_syllable_text("I love poetry")
+    > ['I', 'love', 'poetry', '', '']
+    """
+    return [word if i == 0 else "" for word in line.split(" ") for i in range(len(word_scansion_cache(word)))]
 
 
 def get_syllables_per_line_combined(combined_lines, n_syllables_per_line):
@@ -56,7 +93,7 @@ def get_syllables_per_line_combined(combined_lines, n_syllables_per_line):
     return [sum([n_syllables_per_line[i] for i in tpl]) for tpl in combined_lines]
 
 
-def combine_line_scansions(scansion_list):
+def combine_line_scansions(scansion_list, method="incremental"):
     """
     Returns a list of tuples suggesting which lines to combine based on the number of syllables.
     It aims to create as many lines as possible with length equal to the two longest line lenghts.
@@ -74,6 +111,23 @@ def combine_line_scansions(scansion_list):
       '11101011001',
       '11101111011']
 
+    Lines are merged one window at a time: in every step, the first window of 2, 3 or 4 consecutive lines that adds
+    up to the longest line length is merged, or if there is none, the first window that adds up to the second longest.
+
+    method: 'incremental' (default) only re-examines the windows around each merge, see
+        _combine_line_scansions_incremental. 'greedy' rescans the whole poem after every merge, which is
+        quadratic in the number of lines. Both give the same result; 'greedy' is kept for compatibility.
+    """
+    if method == "incremental":
+        return _combine_line_scansions_incremental(scansion_list)
+    if method == "greedy":
+        return _combine_line_scansions_greedy(scansion_list)
+    raise ValueError(f"Unknown method: {method}")
+
+
+def _combine_line_scansions_greedy(scansion_list):
+    """
+    Implementation of combine_line_scansions that rescans the whole poem after every merge.
     """
     # Count syllables per line
     n_syllables_per_line = [len(x) for x in scansion_list]
@@ -82,6 +136,7 @@ def combine_line_scansions(scansion_list):
     unique_line_lengths = sorted(np.unique(np.array(n_syllables_per_line_combined)), key=lambda item: -item)
     target_line_lengths = unique_line_lengths[: np.min([len(unique_line_lengths), 2])]
 
+    n_merges = 0
     improvement_found = True
     while improvement_found:
 
@@ -105,6 +160,7 @@ def combine_line_scansions(scansion_list):
 
         # If any lines can be combined, merge the tuples of these two lines in the list combined_lines
         if len(idx_start) > 0:
+            n_merges += 1
             idx_lines_to_combine = list(range(idx_start[0], (idx_start[0] + n_lines_to_combine)))
             new_tpl = tuple([x for i in idx_lines_to_combine for x in combined_lines[i]])
             combined_lines[idx_start[0]] = new_tpl
@@ -112,9 +168,89 @@ def combine_line_scansions(scansion_list):
         else:
             improvement_found = False
 
+    if instrumentation.enabled:
+        instrumentation.count("meter.combine_line_scansions", "merges", n_merges)
     return combined_lines
 
 
+def _combine_line_scansions_incremental(scansion_list):
+    """
+    Implementation of combine_line_scansions that keeps a heap per (target length, number of lines) with the start
+    of every window that adds up to the target length. A merge only changes the windows that overlap the merged
+    lines, so after a merge only the windows starting at most three lines before it are re-examined, and entries
+    that are no longer valid are dropped lazily when they reach the top of their heap. This takes O(n log n)
+    operations for a poem of n lines, instead of O(n) per merge.
+    """
+    n_syllables_per_line = [len(x) for x in scansion_list]
+    members = [[x] for x in range(len(n_syllables_per_line)) if n_syllables_per_line[x] > 0]
+    lengths = [n_syllables_per_line[x[0]] for x in members]
+    target_line_lengths = sorted(set(lengths), reverse=True)[:2]
+    windows = [(target_length, n) for target_length in target_line_lengths for n in [2, 3, 4]]
+
+    # The combined lines form a linked list. A combined line is identified by the position of its first line
+    # in 'members', so the order of the identifiers is the order of the lines in the poem.
+    n_combined_lines = len(members)
+    next_line = list(range(1, n_combined_lines)) + [None]
+    previous_line = [None] + list(range(n_combined_lines - 1))
+    is_merged_away = [False] * n_combined_lines
+
+    def window_length(start, n):
+        total = 0
+        line = start
+        for _ in range(n):
+            if line is None:
+                return None
+            total += lengths[line]
+            line = next_line[line]
+        return total
+
+    def push_windows(starts):
+        for start in starts:
+            for window in windows:
+                if window_length(start, window[1]) == window[0]:
+                    heapq.heappush(heaps[window], start)
+
+    heaps = {window: [] for window in windows}
+    push_windows(range(n_combined_lines))
+
+    n_merges = 0
+    while True:
+        for target_length, n in windows:
+            if n >= n_combined_lines:
+                continue
+            heap = heaps[(target_length, n)]
+            while heap and (is_merged_away[heap[0]] or window_length(heap[0], n) != target_length):
+                heapq.heappop(heap)
+            if heap:
+                break
+        else:
+            break
+
+        # Merge the n lines starting at heap[0] into a single line.
+        start = heap[0]
+        line = next_line[start]
+        for _ in range(n - 1):
+            members[start].extend(members[line])
+            lengths[start] += lengths[line]
+            is_merged_away[line] = True
+            line = next_line[line]
+        next_line[start] = line
+        if line is not None:
+            previous_line[line] = start
+        n_combined_lines -= n - 1
+        n_merges += 1
+
+        # Only windows that contain the merged line have changed.
+        starts = [start]
+        while len(starts) < 4 and previous_line[starts[-1]] is not None:
+            starts.append(previous_line[starts[-1]])
+        push_windows(starts)
+
+    if instrumentation.enabled:
+        instrumentation.count("meter.combine_line_scansions", "merges", n_merges)
+    return [tuple(x) for i, x in enumerate(members) if not is_merged_away[i]]
+
+
 def merge_lines(lines, tuple_list, sep=""):
     """
     combines elements from 'lines' according to the logic defined in 'tuple_list'
@@ -150,7 +286,45 @@ def scansion_match_score(found_meter, known_meter):
     return matching_0 + matching_1_frac
 
 
-def get_known_meter(scansion_list, known_meters_inv):
+# The meters used in the analysis, as in the notebooks.
+# * = catalectic, i.e. the last (unstressed) syllable is omitted
+# ** = iambic subsitution, i.e. the first (unstressed) syllable is omitted from an anapestic foot
+known_meters = {
+    "iambic hexameter": "010101010101",
+    "iambic hexameter*": "01010101010",
+    "iambic pentameter": "0101010101",
+    "iambic pentameter*": "010101010",
+    "iambic tetrameter": "01010101",
+    "iambic tetrameter*": "0101010",
+    "iambic trimeter": "010101",
+    "iambic trimeter*": "01010",
+    "iambic dimeter": "0101",
+    "iambic dimeter*": "010",
+    "iambic monometer": "01",
+    "anapestic tetrameter": "001001001001",
+    "anapestic tetrameter**": "01001001001",
+    "anapestic trimeter": "001001001",
+    "anapestic trimeter**": "01001001",
+    "anapestic dimeter": "001001",
+    "anapestic dimeter**": "01001",
+    "anapestic monometer": "001",
+    "trochaic hexameter": "101010101010",
+    "trochaic hexameter*": "10101010101",
+    "trochaic pentameter": "1010101010",
+    "trochaic pentameter*": "101010101",
+    "trochaic tetrameter": "10101010",
+    "trochaic tetrameter*": "1010101",
+    "trochaic trimeter": "101010",
+    "trochaic trimeter*": "10101",
+    "trochaic bimeter": "1010",
+    "trochaic bimeter*": "101",
+    "trochaic monometer": "10",
+    "amphibrachic dimeter": "010010",
+}
+known_meters_inv = {v: k for k, v in known_meters.items()}
+
+
+def get_known_meter(scansion_list, known_meters_inv, tie_break="lexical"):
     """
     Use a list of scansion per line to estimate the meter of the poem. The assumption is
     that a poem always has at most two different known meters. Furthermore, since our method of
@@ -160,6 +334,14 @@ def get_known_meter(scansion_list, known_meters_inv):
 
     scansion_list: A list with scansions per line, denoted as a string with 1's and 0's.
     known_meters_inv: A dict with keys strings of scansions, and as values the corresponding meter name.
+    tie_break: How to pick a meter if multiple meters are predicted equally often for a line length.
+        'lexical': Pick the first meter in alphabetical order.
+        'family': Pick the meter of the family (e.g. 'iambic') that comes first in known_meters_inv, and
+            within a family the first meter in alphabetical order.
+        np.random.Generator: Pick one at random with the given generator.
+        With 'lexical' and 'family', the meter is a pure function of scansion_list and known_meters_inv.
+
+    See KnownMeterMatcher to determine the meter of many poems at once.
 
     Example usage:
     > known_meters_inv = {'1010' : 'trochaic bimeter',
@@ -169,18 +351,24 @@ def get_known_meter(scansion_list, known_meters_inv):
     > ['trochaic bimeter']
 
     """
-    scansion_list = [x for x in scansion_list if "?" not in x]
+    return _matcher_cache(tuple(known_meters_inv.items())).get_known_meter(scansion_list, tie_break)
 
-    # First, create meter_list; a list which elements have the structure [a,b] where a is the number
-    # of syllables in the line, and b a list of the most likely know meters.
-    meter_list = []
-    for scansion in scansion_list:
-        l = [(scansion_match_score(scansion, k), v) for k, v in known_meters_inv.items() if len(k) == len(scansion)]
-        if l:
-            maxValue = max(l, key=lambda x: x[0])[0]
-            maxValueList = [x[1] for x in l if x[0] == maxValue]
-            meter_list.append([len(scansion), maxValueList])
 
+def _get_meter_family(meter):
+    """
+    Example:
+
+    > _get_meter_family('iambic pentameter*')
+    > 'iambic'
+    """
+    return meter.split(" ")[0]
+
+
+def _most_common_meters(meter_list, tie_break, family_rank):
+    """
+    Determine the meter of a poem from meter_list; a list which elements have the structure [a,b] where a is the
+    number of syllables in the line, and b a list of the most likely known meters for that line.
+    """
     # If meter_list has at least one element, create meters_list. The elements in this list
     # contain per line length all the predicted meters, still to be flattened.
     # If more than two elements, we only look at the stats for the two most common line lengths.
@@ -191,18 +379,204 @@ def get_known_meter(scansion_list, known_meters_inv):
         values = values[(-counts).argsort()][: np.min([len(values), 2])]
         meters_list = [[y[1] for y in meter_list if y[0] == val] for val in values]
 
-        # Now, find per line length the most commonly predicted meter. In case of a tie, pick one at random.
-        # Sorry, best we can do for now...
+        # Now, find per line length the most commonly predicted meter. In case of a tie, use tie_break.
         result = list()
         for meters_per_line_length in meters_list:
             flat_list = [item for sublist in meters_per_line_length for item in sublist]
             (values, counts) = np.unique(flat_list, return_counts=True)
             ind = np.where(counts == np.max(counts))
             if len(ind[0]) > 1:
-                result.append(np.random.choice(values[ind]))
+                result.append(_break_tie(values[ind], tie_break, family_rank))
             else:
                 result.append(values[ind][0])
         result.sort()
     else:
         result = "unknown"
     return result
+
+
+def _break_tie(meters, tie_break, family_rank):
+    """
+    Pick one of the meters, which are sorted alphabetically, according to tie_break. See get_known_meter.
+    """
+    if isinstance(tie_break, np.random.Generator):
+        return tie_break.choice(meters)
+    if tie_break == "lexical":
+        return meters[0]
+    if tie_break == "family":
+        return min(meters, key=lambda meter: family_rank[_get_meter_family(meter)])
+    raise ValueError(f"Unknown tie_break: {tie_break}")
+
+
+class KnownMeterMatcher:
+    """
+    Matches scansions against a table of known meters with matrix operations, instead of calling
+    scansion_match_score for every (line, known meter) pair. The known meters are grouped by length into 0/1
+    matrices once, after which all lines of a poem, or of a batch of poems, with the same length are scored against
+    all known meters of that length in one go. Gives exactly the same results as get_known_meter.
+
+    known_meters_inv: A dict with keys strings of scansions, and as values the corresponding meter name.
+
+    Example usage:
+    > matcher = KnownMeterMatcher(known_meters_inv)
+    > matcher.get_known_meters([['1010','1010','1011','1010'], ['101','101']])
+    > [['trochaic bimeter'], ['trochaic bimeter*']]
+    """
+
+    eps = 0.00001
+
+    def __init__(self, known_meters_inv):
+        meters_per_length = {}
+        for k, v in known_meters_inv.items():
+            meters_per_length.setdefault(len(k), []).append((k, v))
+
+        # Rank of each meter family by first occurence in the table, used for tie_break='family'.
+        self._family_rank = {}
+        for v in known_meters_inv.values():
+            self._family_rank.setdefault(_get_meter_family(v), len(self._family_rank))
+
+        # Per line length: the known meters as 0/1 matrix, the number of 1's per meter and the meter names.
+        self._meters_per_length = {}
+        for length, meters in meters_per_length.items():
+            known = self._to_matrix([k for k, _ in meters], length)
+            self._meters_per_length[length] = (known, known.sum(axis=1), [v for _, v in meters])
+
+    def get_known_meter(self, scansion_list, tie_break="lexical"):
+        """
+        Same as get_known_meter(scansion_list, known_meters_inv, tie_break).
+        """
+        return self.get_known_meters([scansion_list], tie_break)[0]
+
+    def get_known_meters(self, scansion_lists, tie_break="lexical"):
+        """
+        Returns the known meter for each element of scansion_lists, a list with per poem a list of scansions.
+        See get_known_meter for tie_break.
+        """
+        if not (isinstance(tie_break, np.random.Generator) or tie_break in ("lexical", "family")):
+            raise ValueError(f"Unknown tie_break: {tie_break}")
+        scansion_lists = [[x for x in scansion_list if "?" not in x] for scansion_list in scansion_lists]
+        lines = [(i, scansion) for i, scansion_list in enumerate(scansion_lists) for scansion in scansion_list]
+        best_meters = self._best_meters([scansion for _, scansion in lines])
+
+        meter_lists = [[] for _ in scansion_lists]
+        for (i, scansion), meters in zip(lines, best_meters):
+            if meters is not None:
+                meter_lists[i].append([len(scansion), meters])
+        return [_most_common_meters(meter_list, tie_break, self._family_rank) for meter_list in meter_lists]
+
+    def _best_meters(self, scansions):
+        """
+        Returns per scansion the list of known meters with the highest scansion_match_score,
+        or None if there are no known meters with the same length.
+        """
+        positions_per_length = {}
+        for position, scansion in enumerate(scansions):
+            positions_per_length.setdefault(len(scansion), []).append(position)
+
+        best_meters = [None] * len(scansions)
+        for length, positions in positions_per_length.items():
+            if length not in self._meters_per_length:
+                continue
+            known, n_ones, names = self._meters_per_length[length]
+            found = self._to_matrix([scansions[position] for position in positions], length)
+            matching_0 = (1 - found) @ (1 - known).T
+            matching_1 = found @ known.T
+            scores = matching_0 + (matching_1 / n_ones - self.eps)
+            is_best = scores == scores.max(axis=1, keepdims=True)
+            for position, row in zip(positions, is_best.tolist()):
+                best_meters[position] = [name for name, best in zip(names, row) if best]
+        return best_meters
+
+    @staticmethod
+    def _to_matrix(scansions, length):
+        """
+        Converts a list of scansions of the same length to a 0/1 matrix with one row per scansion.
+        """
+        characters = np.frombuffer("".join(scansions).encode("ascii"), dtype=np.uint8)
+        return (characters == ord("1")).astype(float).reshape(len(scansions), length)
+
+
+# Matchers per known_meters_inv table, so get_known_meter only builds the matrices once per table.
+_matcher_cache = LRUCache(lambda known_meters: KnownMeterMatcher(dict(known_meters)), maxsize=8)
+
+
+def analyze_poems(df, known_meters_inv, workers=1, chunksize=500, tie_break="lexical", index_dir=None):
+    """
+    Run the meter analysis for all poems in the column 'poem' of df; determine the scansion per line, combine lines
+    with combine_line_scansions and estimate the meter with get_known_meter.
+
+    df: A DataFrame with a column 'poem', in which line breaks are denoted with '>'.
+    known_meters_inv: A dict with keys strings of scansions, and as values the corresponding meter name.
+    workers: Number of processes to use. With workers=1, everything runs in the current process.
+    chunksize: Number of poems per task sent to a worker process.
+    tie_break: See get_known_meter.
+    index_dir: Optional directory with a compiled CMUdict index (see src.cmudict_index) to load in every worker.
+        Without it, every worker loads the pronouncing package's dictionary once at startup. With workers=1, the
+        index is only used during this call; the index used by the calling process does not change.
+
+    Returns a DataFrame with the same index as df, and the columns
+        scansion: The scansion per line.
+        lines_to_combine: The tuples with lines to combine, from combine_line_scansions.
+        scansion_modified: The scansion per line after combining lines.
+        poem_modified: The poem after combining lines.
+        meter_list: The known meters of the poem, or 'unknown'.
+        meter: The known meters of the poem as a comma-separated string.
+    """
+    poems = df["poem"].tolist()
+    chunks = [poems[i : i + chunksize] for i in range(0, len(poems), chunksize)]
+    with instrumentation.stage("meter.analyze_poems", rows=len(poems)):
+        if workers == 1:
+            with using_index(index_dir):
+                results = [_analyze_chunk(chunk, known_meters_inv, tie_break) for chunk in chunks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(index_dir,)) as executor:
+                results = list(executor.map(_analyze_chunk, chunks, repeat(known_meters_inv), repeat(tie_break)))
+
+    columns = ["scansion", "lines_to_combine", "scansion_modified", "poem_modified", "meter_list", "meter"]
+    return pd.DataFrame([row for chunk in results for row in chunk], index=df.index, columns=columns)
+
+
+def _init_worker(index_dir):
+    """
+    Load the pronunciation data once per worker process, instead of on the first lookup of every task.
+    """
+    if index_dir is not None:
+        use_index(index_dir)
+    else:
+        pronouncing.init_cmu()
+
+
+def _analyze_chunk(poems, known_meters_inv, tie_break):
+    """
+    Returns per poem the row of analyze_poems, as a tuple. The stages are recorded in src.instrumentation, but only
+    in the process that runs them, so with workers > 1 only the total of analyze_poems is recorded.
+    """
+    poems_as_list = [poem.split(">") for poem in poems]
+
+    with instrumentation.stage("meter.scansion", rows=len(poems)):
+        hits, misses = word_scansion_cache.hits, word_scansion_cache.misses
+        scansions = [[get_line_scansion(line) for line in poem_as_list] for poem_as_list in poems_as_list]
+    if instrumentation.enabled:
+        instrumentation.count("meter.scansion", "lines", sum(len(x) for x in scansions))
+        new_hits, new_misses = word_scansion_cache.hits - hits, word_scansion_cache.misses - misses
+        instrumentation.count("meter.scansion", "word_lookups", new_hits + new_misses)
+        instrumentation.count("meter.scansion", "word_lookup_misses", new_misses)
+        instrumentation.count("meter.scansion", "unknown_words", sum(x.count("?") for y in scansions for x in y))
+
+    with instrumentation.stage("meter.combine_line_scansions", rows=len(poems)):
+        rows = []
+        for poem_as_list, scansion in zip(poems_as_list, scansions):
+            lines_to_combine = combine_line_scansions(scansion)
+            scansion_modified = merge_lines(scansion, lines_to_combine)
+            poem_modified = ">".join(merge_lines(poem_as_list, lines_to_combine, sep=" "))
+            rows.append([scansion, lines_to_combine, scansion_modified, poem_modified])
+
+    with instrumentation.stage("meter.get_known_meter", rows=len(poems)):
+        matcher = _matcher_cache(tuple(known_meters_inv.items()))
+        meter_lists = matcher.get_known_meters([row[2] for row in rows], tie_break)
+    if instrumentation.enabled:
+        n_unknown = sum(x == "unknown" for x in meter_lists)
+        instrumentation.count("meter.get_known_meter", "unknown_meters", n_unknown)
+    for row, meter_list in zip(rows, meter_lists):
+        row += [meter_list, ", ".join(meter_list) if isinstance(meter_list, list) else meter_list]
+    return [tuple(row) for row in rows]
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import pickle
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+from src.lazy import lazy_import
+from src.cmudict_index import using_index
+from src.data_frame_parser import DataFrameParser
+from src.meter import analyze_poems
+from src.rhyme import extract_last_words, get_rhyme_schemes
+
+pd = lazy_import("pandas")
+
+# Bump when a change to the meter or rhyme analysis changes its results, so cached results are not reused.
+ANALYSIS_VERSION = 1
+
+analysis_columns = [
+    "scansion",
+    "lines_to_combine",
+    "scansion_modified",
+    "poem_modified",
+    "meter_list",
+    "meter",
+    "last_words_list",
+    "rhyme_scheme",
+]
+
+
+class AnalysisCache:
+    """
+    Stores the results of the meter and rhyme analysis per poem in a SQLite database, keyed by the comment id, a hash
+    of the cleaned text of the poem and a hash of the analysis parameters. A result is only reused if the poem and the
+    parameters are unchanged.
+
+    path: The path of the SQLite database file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS analysis "
+                "(id TEXT NOT NULL, params_hash TEXT NOT NULL, poem_hash TEXT NOT NULL, result BLOB NOT NULL, "
+                "PRIMARY KEY (id, params_hash))"
+            )
+
+    def get(self, ids, poem_hashes, params_hash):
+        """
+        Returns a dict with comment id as key and the cached result as value, for the comments of which the result for
+        params_hash is cached and the hash of the poem matches.
+        """
+        expected = dict(zip(ids, poem_hashes))
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT id, poem_hash, result FROM analysis WHERE params_hash = ?", [params_hash]
+            ).fetchall()
+        return {id: pickle.loads(result) for id, poem_hash, result in rows if expected.get(id) == poem_hash}
+
+    def put(self, ids, poem_hashes, params_hash, results):
+        """
+        Store the results of comments, replacing earlier results for the same parameters.
+        """
+        rows = [
+            (id, params_hash, poem_hash, pickle.dumps(result))
+            for id, poem_hash, result in zip(ids, poem_hashes, results)
+        ]
+        with self._connect() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO analysis (id, params_hash, poem_hash, result) VALUES (?, ?, ?, ?)", rows
+            )
+
+    def clear(self):
+        with self._connect() as connection:
+            connection.execute("DELETE FROM analysis")
+
+    @contextmanager
+    def _connect(self):
+        """
+        Opens a connection that commits on success, rolls back on an exception and is always closed.
+        """
+        connection = sqlite3.connect(self.path)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+
+def run_pipeline(
+    df_comments,
+    known_meters_inv,
+    cache_path=None,
+    workers=1,
+    chunksize=500,
+    tie_break="lexical",
+    near_rhyme_distance=None,
+    index_dir=None,
+):
+    """
+    Parse the comments as returned by RedditUserCommentReader.read(), and run the meter and rhyme analysis for all
+    poems. With cache_path, the results are stored in an AnalysisCache, and only new poems, changed poems and poems
+    that were analyzed with other parameters are analyzed again, so a rerun after reading a few new comments only
+    analyzes these comments.
+
+    df_comments: DataFrame with comments, as returned by RedditUserCommentReader.read().
+    known_meters_inv: A dict with keys strings of scansions, and as values the corresponding meter name.
+    cache_path: Optional path of the SQLite database of the AnalysisCache.
+    workers, chunksize, tie_break, index_dir: See analyze_poems.
+    near_rhyme_distance: See get_rhyme_scheme.
+
+    Returns the parsed DataFrame of the poems, with the columns of analyze_poems and the columns 'last_words_list'
+    and 'rhyme_scheme'.
+    """
+    df = DataFrameParser().parse(df_comments)
+    df = df[df["type"] == "poem"].copy()
+
+    ids = df["id"].tolist()
+    poem_hashes = [hashlib.sha1(poem.encode("utf-8")).hexdigest() for poem in df["poem"]]
+    cache = AnalysisCache(cache_path) if cache_path is not None else None
+    if cache is not None:
+        params_hash = get_params_hash(known_meters_inv, tie_break, near_rhyme_distance)
+        cached = cache.get(ids, poem_hashes, params_hash)
+    else:
+        cached = {}
+
+    is_new = [id not in cached for id in ids]
+    df_new = df[is_new]
+    df_results = _analyze(df_new, known_meters_inv, workers, chunksize, tie_break, near_rhyme_distance, index_dir)
+    new_results = list(df_results.itertuples(index=False, name=None))
+    if cache is not None and new_results:
+        cache.put(df_new["id"].tolist(), [h for h, x in zip(poem_hashes, is_new) if x], params_hash, new_results)
+
+    new_results = iter(new_results)
+    results = [next(new_results) if x else cached[id] for id, x in zip(ids, is_new)]
+    df_analysis = pd.DataFrame(results, index=df.index, columns=analysis_columns)
+    return pd.concat([df, df_analysis], axis=1)
+
+
+def get_params_hash(known_meters_inv, tie_break, near_rhyme_distance):
+    """
+    Returns a hash of everything besides the poem itself that determines the results of the analysis. The order of
+    known_meters_inv is included, since it can determine the outcome of ties.
+    """
+    if not isinstance(tie_break, str):
+        raise ValueError("Results with a random tie_break can not be cached.")
+    params = {
+        "analysis_version": ANALYSIS_VERSION,
+        "known_meters_inv": list(known_meters_inv.items()),
+        "tie_break": tie_break,
+        "near_rhyme_distance": near_rhyme_distance,
+    }
+    return hashlib.sha1(json.dumps(params).encode("utf-8")).hexdigest()
+
+
+def _analyze(df, known_meters_inv, workers, chunksize, tie_break, near_rhyme_distance, index_dir):
+    df_meter = analyze_poems(
+        df, known_meters_inv, workers=workers, chunksize=chunksize, tie_break=tie_break, index_dir=index_dir
+    )
+    df_meter["last_words_list"] = extract_last_words(df_meter["poem_modified"])
+    with using_index(index_dir):
+        df_meter["rhyme_scheme"] = get_rhyme_schemes(df_meter["last_words_list"], near_rhyme_distance)
+    return df_meter[analysis_columns]
@@ -1,8 +1,14 @@
-import plotly.graph_objs as go
-import plotly.figure_factory as ff
-from plotly.subplots import make_subplots
+import base64
+import json
+from pathlib import Path
 from typing import List
-import numpy as np
+from src.lazy import lazy_import
+
+go = lazy_import("plotly.graph_objs")
+ff = lazy_import("plotly.figure_factory")
+subplots = lazy_import("plotly.subplots")
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
 
 default_plotly_colors = [
     "#1f77b4",
@@ -20,6 +26,10 @@ default_plotly_colors = [
 main_color = "#336699"
 border_color = "#7D9DBD"
 
+# Above this number of points, scatter plots are rendered with WebGL (go.Scattergl) instead of SVG, since browsers
+# become unresponsive with many SVG elements.
+webgl_threshold = 10000
+
 
 def plot_histogram(x, title, xaxis_title, yaxis_title, params: dict = None):
     """
@@ -43,7 +53,7 @@ def plot_histogram(x, title, xaxis_title, yaxis_title, params: dict = None):
     return fig
 
 
-def plot_timeline(x, y, title, xaxis_title, yaxis_title, annotations: List = None):
+def plot_timeline(x, y, title, xaxis_title, yaxis_title, annotations: List = None, max_points: int = None):
     """
     x: The x values
     y: The y values
@@ -51,9 +61,16 @@ def plot_timeline(x, y, title, xaxis_title, yaxis_title, annotations: List = Non
     xaxis_title: Tile of the x-axis
     yaxis_title: Tile of the y-axis
     params: Other params to pass to go.Histogram()
+    max_points: optional, the maximum number of points to plot. Longer timelines are downsampled with
+        Largest-Triangle-Three-Buckets, which keeps the visual shape of the line. See lttb().
     """
+    positions = lttb(x, y, max_points)
     fig = go.Figure()
-    fig.add_trace(go.Scatter(x=x, y=y, mode="lines", name="lines", line=dict(color=main_color)))
+    fig.add_trace(
+        go.Scatter(
+            x=_take(x, positions), y=_take(y, positions), mode="lines", name="lines", line=dict(color=main_color)
+        )
+    )
     fig.update_layout(
         title=title,
         title_x=0.5,
@@ -170,17 +187,17 @@ def plot_grouped_scatter(
     """
     fig = go.Figure()
 
-    for group in unique_groups:
-        idx = groups == group
+    scatter = _get_scatter_class(len(x))
+    for group, positions in zip(unique_groups, _get_group_positions(groups, unique_groups)):
         fig.add_trace(
-            go.Scatter(
-                x=x[idx],
-                y=y[idx],
+            scatter(
+                x=_take(x, positions),
+                y=_take(y, positions),
                 mode="markers",
                 name=group,
                 marker=marker,
                 hoverinfo="text",
-                text=np.array(text)[idx],
+                text=np.array(text)[positions],
             )
         )
 
@@ -204,6 +221,7 @@ def plot_multiple_timelines(
     xaxis_title,
     yaxis_title,
     figsize: tuple = (600, 900),
+    max_points: int = None,
 ):
     """
     Returns a plot with multiple timelines, one for each group in unique_groups.
@@ -216,6 +234,7 @@ def plot_multiple_timelines(
     xaxis_title: Tile of the x-axis
     yaxis_title: Tile of the y-axis
     figsize: tuple (width, height) of plot.
+    max_points: optional, the maximum number of points to plot per timeline, see plot_timeline.
     """
 
     default_plotly_colors = [
@@ -233,18 +252,23 @@ def plot_multiple_timelines(
     default_plotly_colors = default_plotly_colors + ["grey"]
 
     fig = go.Figure()
-    fig = make_subplots(rows=len(unique_groups), cols=1, x_title=xaxis_title, y_title=yaxis_title)
+    fig = subplots.make_subplots(rows=len(unique_groups), cols=1, x_title=xaxis_title, y_title=yaxis_title)
 
-    for ix, group in enumerate(unique_groups):
-        subset = groups == group
+    positions_per_group = [
+        positions[lttb(_take(x, positions), _take(y, positions), max_points)]
+        for positions in _get_group_positions(groups, unique_groups)
+    ]
+    # Decide on WebGL from the number of points that are plotted, after downsampling.
+    scatter = _get_scatter_class(sum(len(positions) for positions in positions_per_group))
+    for ix, (group, positions) in enumerate(zip(unique_groups, positions_per_group)):
         fig.append_trace(
-            go.Scatter(
-                x=x[subset],
-                y=y[subset],
+            scatter(
+                x=_take(x, positions),
+                y=_take(y, positions),
                 mode="lines",
                 name=group,
                 hoverinfo="text",
-                text=text[subset],
+                text=_take(text, positions),
                 marker_color=default_plotly_colors[ix],
             ),
             row=ix + 1,
@@ -302,11 +326,36 @@ def plot_events_timeline(x, y, text, title, xaxis_title, yaxis_title):
     return fig
 
 
-def plot_meter(text, meter, title, colorscale):
+def plot_meter(text, meter, title, colorscale, method="annotations"):
     """
     Plot the meter of some text.
+    text: 2d-list with the text for each syllable
+    meter: 2d-list with the stress of each syllable, 0 or 1, and np.nan for padding
+    title: Title of the plot
+    colorscale: The colors for unstressed and stressed syllables, e.g. ['#d2d2d2', '#336699']
+    method: 'annotations' to create one layout annotation per syllable with ff.create_annotated_heatmap, or
+        'texttemplate' to draw the text of all syllables in the heatmap trace itself. The latter is much faster to
+        build, serialize and display for long poems.
     """
-    fig = ff.create_annotated_heatmap(z=meter, annotation_text=text, colorscale=colorscale, hoverinfo="none")
+    if method == "annotations":
+        fig = ff.create_annotated_heatmap(z=meter, annotation_text=text, colorscale=colorscale, hoverinfo="none")
+    elif method == "texttemplate":
+        fig = go.Figure(
+            go.Heatmap(
+                z=meter,
+                text=text,
+                texttemplate="%{text}",
+                colorscale=colorscale,
+                showscale=False,
+                hoverinfo="none",
+            )
+        )
+        fig.update_layout(
+            xaxis=dict(ticks="", side="top", gridcolor="rgb(0, 0, 0)", showticklabels=False),
+            yaxis=dict(ticks="", ticksuffix="  ", showticklabels=False),
+        )
+    else:
+        raise ValueError(f"Unknown method '{method}', use 'annotations' or 'texttemplate'.")
     fig.update_layout(
         height=40 + 40 * len(meter),
         width=50 * max(len(x) for x in meter) + 200,
@@ -321,6 +370,30 @@ def plot_meter(text, meter, title, colorscale):
     return fig
 
 
+def plot_meters(scansion_lists, titles, colorscale, text_lists=None):
+    """
+    Returns a list with a meter plot for every poem, with the first line at the top.
+    scansion_lists: For each poem the list with the scansion of each line, as returned by get_line_scansion.
+        Syllables that are not in the dictionary, '?', are left blank.
+    titles: The title of each plot
+    colorscale: The colors for unstressed and stressed syllables, e.g. ['#d2d2d2', '#336699']
+    text_lists: optional, for each poem the list with the text for each syllable of each line, such as the output of
+        src.meter.get_line_syllable_text. By default, the syllables have no text.
+    """
+    figs = []
+    for i, (scansion_list, title) in enumerate(zip(scansion_lists, titles)):
+        n_syllables = max([len(scansion) for scansion in scansion_list] + [1])
+        meter = np.full((len(scansion_list), n_syllables), np.nan)
+        text = np.full((len(scansion_list), n_syllables), "", dtype=object)
+        for row, scansion in enumerate(scansion_list):
+            stresses = np.array(list(scansion), dtype=object)
+            meter[row, : len(scansion)] = np.where(stresses == "?", np.nan, stresses).astype(float)
+            if text_lists is not None:
+                text[row, : len(text_lists[i][row])] = text_lists[i][row]
+        figs.append(plot_meter(text[::-1].tolist(), meter[::-1].tolist(), title, colorscale, method="texttemplate"))
+    return figs
+
+
 def plot_grouped_boxplot(df, obs_col, group_col, unique_groups, title):
     """
     Returns a grouped box plot.
@@ -332,9 +405,8 @@ def plot_grouped_boxplot(df, obs_col, group_col, unique_groups, title):
     """
     fig = go.Figure()
 
-    for group in unique_groups:
-        df_subset = df[df[group_col] == group]
-        fig.add_trace(go.Box(y=df_subset[obs_col], name=group, boxpoints="outliers"))
+    for group, positions in zip(unique_groups, _get_group_positions(df[group_col], unique_groups)):
+        fig.add_trace(go.Box(y=df[obs_col].iloc[positions], name=group, boxpoints="outliers"))
 
     fig.update_layout(title_text=title, height=1200, title_x=0.5, template="simple_white")
     return fig
@@ -366,11 +438,11 @@ def plot_overlayed_histogram(df, obs_col, group_col, unique_groups, title, xaxis
     ]
 
     fig = go.Figure()
-    for ix, group in unique_groups.items():
-        df_subset = df[df[group_col] == group]
+    group_positions = _get_group_positions(df[group_col], unique_groups)
+    for (ix, group), positions in zip(unique_groups.items(), group_positions):
         fig.add_trace(
             go.Histogram(
-                x=df_subset[obs_col],
+                x=df[obs_col].iloc[positions],
                 name=group,
                 marker_color=default_plotly_colors[ix],
                 histnorm="percent",
@@ -389,3 +461,162 @@ def plot_overlayed_histogram(df, obs_col, group_col, unique_groups, title, xaxis
     )
     fig.update_traces(opacity=0.5)
     return fig
+
+
+def export_figures(figures: dict, min_length: int = 8, typed_arrays: bool = False):
+    """
+    Write figures to JSON files in one batch, like fig.write_json(path), and report the size of each file.
+
+    With typed_arrays=True, numeric arrays in the traces with at least min_length values are written in plotly's
+    typed-array encoding, {"dtype": ..., "bdata": <base64>, "shape": ...}, with the smallest integer or float type
+    that holds the values exactly. This makes files with many points much smaller, but they can only be rendered by
+    plotly.js 2.28 or later. The plotly version in poetry.lock (5.6.0) bundles plotly.js 2.9, which cannot decode
+    them, and plotly.io.read_json cannot read them back either. Only use it for a site that loads a recent plotly.js.
+
+    Hover text is not reduced: the per-point poem text of e.g. plot_scatter is written as is, since plotly.js has no
+    way to share strings between points.
+
+    figures: dict with the path of the file as key and the figure as value.
+    min_length: The minimum length of the arrays to encode as typed arrays.
+    typed_arrays: Whether to use the typed-array encoding, see above.
+    Returns a DataFrame with the size of each file as written by fig.to_json and as exported, in bytes.
+    """
+    rows = []
+    for path, fig in figures.items():
+        fig_json = fig.to_json()
+        compact_json = to_compact_json(json.loads(fig_json), min_length, typed_arrays)
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        Path(path).write_text(compact_json)
+        rows.append({"path": path, "original_bytes": len(fig_json), "compact_bytes": len(compact_json)})
+    df = pd.DataFrame(rows, columns=["path", "original_bytes", "compact_bytes"])
+    df["saved_bytes"] = df["original_bytes"] - df["compact_bytes"]
+    return df
+
+
+def to_compact_json(fig_dict, min_length: int = 8, typed_arrays: bool = False):
+    """
+    Returns the JSON of a figure dict, e.g. json.loads(fig.to_json()), as written by export_figures.
+    """
+    data = fig_dict.get("data", [])
+    if typed_arrays:
+        data = [_compact_trace(trace, min_length) for trace in data]
+    return json.dumps({**fig_dict, "data": data}, separators=(",", ":"))
+
+
+def _compact_trace(trace, min_length):
+    compact = {}
+    for key, value in trace.items():
+        if isinstance(value, dict):
+            compact[key] = _compact_trace(value, min_length)
+        elif not isinstance(value, list) or len(value) < min_length:
+            compact[key] = value
+        else:
+            compact[key] = _encode_typed_array(value) or value
+    return compact
+
+
+# Typed arrays supported by plotly.js, from the smallest to the largest.
+_typed_array_integer_types = [("i1", "<i1"), ("u1", "<u1"), ("i2", "<i2"), ("u2", "<u2"), ("i4", "<i4"), ("u4", "<u4")]
+
+
+def _encode_typed_array(values):
+    """
+    Returns the typed-array encoding of a 1d or 2d list of numbers, in which None stands for a missing value, or None
+    if values is not such a list.
+    """
+    is_2d = isinstance(values[0], list)
+    rows = values if is_2d else [values]
+    if is_2d and not all(isinstance(row, list) and len(row) == len(rows[0]) for row in rows):
+        return None
+    flat = [x for row in rows for x in row]
+    if not all(x is None or (isinstance(x, (int, float)) and not isinstance(x, bool)) for x in flat):
+        return None
+    if all(x is None for x in flat):
+        return None
+    array = np.array([np.nan if x is None else x for x in flat], dtype=float)
+
+    dtype = None
+    if not np.isnan(array).any() and (array == np.round(array)).all():
+        for name, numpy_dtype in _typed_array_integer_types:
+            info = np.iinfo(numpy_dtype)
+            if info.min <= array.min() and array.max() <= info.max:
+                dtype = name, numpy_dtype
+                break
+    if dtype is None:
+        is_float32 = (array.astype(np.float32) == array) | np.isnan(array)
+        dtype = ("f4", "<f4") if is_float32.all() else ("f8", "<f8")
+
+    encoded = {"dtype": dtype[0], "bdata": base64.b64encode(array.astype(dtype[1]).tobytes()).decode("ascii")}
+    if is_2d:
+        encoded["shape"] = f"{len(rows)}, {len(rows[0])}"
+    return encoded
+
+
+def lttb(x, y, max_points):
+    """
+    Returns the positions of at most max_points points of the line (x, y) that are selected with the
+    Largest-Triangle-Three-Buckets algorithm. The first and last points are always kept. The other points are
+    divided in max_points - 2 buckets, and from each bucket the point is kept that forms the largest triangle with
+    the previously kept point and the average of the next bucket. This keeps the peaks and troughs of the line.
+
+    x: x values in ascending order: numbers, or dates such as datetime64 values, datetime.date objects, Timestamps
+        with a timezone or Periods. Other values, e.g. strings, are taken to be evenly spaced.
+    y: y values
+    max_points: The maximum number of points. None, or a number smaller than 3, means no downsampling.
+    """
+    n = len(y)
+    if max_points is None or max_points < 3 or n <= max_points:
+        return np.arange(n)
+
+    x = _to_numeric_x(x)
+    y = np.asarray(y, dtype=float)
+
+    # Bucket i is edges[i]:edges[i+1], the last bucket ends at the last point.
+    edges = np.arange(max_points - 1) * (n - 2) // (max_points - 2) + 1
+    positions = np.empty(max_points, dtype=np.int64)
+    positions[0] = a = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+        areas = np.abs((x[a] - next_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y - y[a]))
+        a = start + int(np.argmax(areas))
+        positions[i + 1] = a
+    positions[-1] = n - 1
+    return positions
+
+
+def _to_numeric_x(x):
+    """
+    Returns x as a float array for lttb, with dates as nanoseconds since the epoch in UTC.
+    """
+    x = pd.Series(x) if not isinstance(x, pd.Series) else x
+    if pd.api.types.is_numeric_dtype(x) and not pd.api.types.is_bool_dtype(x):
+        return x.to_numpy(dtype=float)
+    if isinstance(x.dtype, pd.PeriodDtype):
+        x = x.dt.to_timestamp()
+    try:
+        x = pd.to_datetime(x, utc=True)
+    except (TypeError, ValueError):
+        return np.arange(len(x), dtype=float)
+    return x.dt.tz_convert(None).to_numpy(dtype="datetime64[ns]").astype(np.int64).astype(float)
+
+
+def _get_group_positions(groups, unique_groups):
+    """
+    Returns, for every group in unique_groups, the positions of its observations in groups, in their original order.
+    The observations are partitioned with one stable sort, instead of a comparison of all observations per group.
+    """
+    categories = pd.Index(pd.unique(pd.Series(list(unique_groups), dtype=object)))
+    codes = pd.Categorical(groups, categories=categories).codes
+    order = np.argsort(codes, kind="stable")
+    offsets = np.searchsorted(codes[order], np.arange(len(categories) + 1))
+    return [order[offsets[i] : offsets[i + 1]] for i in categories.get_indexer(list(unique_groups))]
+
+
+def _take(values, positions):
+    return values.iloc[positions] if isinstance(values, pd.Series) else np.asarray(values)[positions]
+
+
+def _get_scatter_class(n_points):
+    return go.Scattergl if n_points > webgl_threshold else go.Scatter
@@ -1,41 +1,125 @@
-import glob
-import re
-import requests
+import threading
+import time
 import datetime as dt
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import pandas as pd
+from src.comment_store import PickleCommentStore
+from src.lazy import lazy_import
+
+requests = lazy_import("requests")
+requests_adapters = lazy_import("requests.adapters")
+pd = lazy_import("pandas")
 
 
 class RedditUserCommentReader:
-    def __init__(self, author: str, data_dir: str):
+    def __init__(
+        self,
+        author: str,
+        data_dir: str,
+        store=None,
+        max_in_flight: int = 4,
+        requests_per_second: float = 2,
+        pushshift_url: str = "https://api.pushshift.io/reddit/comment/search/",
+        reddit_info_url: str = "https://api.reddit.com/api/info",
+    ):
+        """
+        author: The Reddit user to read the comments of.
+        data_dir: The directory to store the comments in.
+        store: Optional storage backend from src.comment_store, e.g. SQLiteCommentStore(f"{data_dir}/comments.db").
+            Defaults to a PickleCommentStore in data_dir.
+        max_in_flight: Maximum number of batches of which the comment data is being requested or stored at once.
+        requests_per_second: Maximum number of requests per second to each of the two APIs. None for no limit.
+        pushshift_url: URL of the Pushshift comment search endpoint, e.g. to point to a local stub server in tests.
+        reddit_info_url: URL of the Reddit info endpoint.
+        """
         self.author = author
         self.data_dir = data_dir
         self._create_data_dir_if_not_exists()
+        self.store = store if store is not None else PickleCommentStore(data_dir)
+        self.max_in_flight = max_in_flight
+        self.pushshift_url = pushshift_url
+        self.reddit_info_url = reddit_info_url
 
-    def read(self):
-        last_comment_found = False
-        while not last_comment_found:
-            latest_comment_utc = self._get_latest_read_comment_utc()
-            comment_ids = self._get_batch_of_comment_ids_from_pushshift(from_utc=latest_comment_utc)
-            if len(comment_ids) < 1:
-                last_comment_found = True
-            else:
-                df_comments = self._get_comment_data_from_reddit_api(comment_ids)
-                print(dt.datetime.fromtimestamp(int(df_comments.created_utc.max())))
-                df_comments.to_pickle(
-                    f"{self.data_dir}/df_{int(df_comments.created_utc.min())}_{int(df_comments.created_utc.max())}.pickle"
-                )
-        return self._read_all_pickle_files()
+        # A single session reuses its connections, instead of a new TCP/TLS handshake per request.
+        self.session = requests.Session()
+        adapter = requests_adapters.HTTPAdapter(pool_maxsize=max_in_flight + 1)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._pushshift_rate_limiter = _RateLimiter(requests_per_second)
+        self._reddit_rate_limiter = _RateLimiter(requests_per_second)
+
+    def read(self, columns=None):
+        """
+        Reads all comments that are newer than the latest stored comment, and returns all stored comments.
+        With columns, only these columns are returned.
+
+        The requests are pipelined: while the comment data of a batch is requested from the Reddit API and stored,
+        the ids of the next batch are already requested from Pushshift. Batches are stored in order, and once a
+        batch fails none of the later batches are stored, so the high-water mark of the store never skips a batch.
+        The exception of the failed batch is raised, and the next call to read() continues from that batch.
+        """
+        from_utc = self.store.get_high_water_mark()
+        failed = threading.Event()
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor, ThreadPoolExecutor(
+            max_workers=1
+        ) as writer:
+            # Pairs of the futures of the comment data and of storing it, per batch.
+            batches_in_flight = deque()
+            try:
+                while True:
+                    comments = self._get_batch_of_comments_from_pushshift(from_utc=from_utc)
+                    if len(comments) < 1:
+                        break
+                    from_utc = max(int(comment["created_utc"]) for comment in comments)
+                    df_future = executor.submit(self._get_comment_data_from_reddit_api, [x["id"] for x in comments])
+                    batches_in_flight.append((df_future, writer.submit(self._store_batch, df_future, failed)))
+                    while len(batches_in_flight) >= self.max_in_flight:
+                        batches_in_flight.popleft()[1].result()
+                for _, store_future in batches_in_flight:
+                    store_future.result()
+            except BaseException:
+                failed.set()
+                for df_future, store_future in batches_in_flight:
+                    df_future.cancel()
+                    store_future.cancel()
+                raise
+        return self.store.load(columns)
+
+    def read_iter(self):
+        """
+        Yields the comments that have been read so far one batch at a time, in chronological order, without
+        reading new comments first. See DataFrameParser.parse_iter.
+        """
+        return self.store.iter_batches()
 
     def _create_data_dir_if_not_exists(self):
         Path(self.data_dir).mkdir(parents=True, exist_ok=True)
 
-    def _get_batch_of_comment_ids_from_pushshift(self, from_utc):
+    def _store_batch(self, df_future, failed):
+        """
+        Stores the comments of a batch, unless an earlier batch failed: storing a later batch would move the
+        high-water mark past the failed one, which would then never be read again.
         """
+        if failed.is_set():
+            return
+        try:
+            df_comments = df_future.result()
+            if len(df_comments) > 0:
+                print(dt.datetime.fromtimestamp(int(df_comments.created_utc.max())))
+                self.store.append(df_comments)
+        except BaseException:
+            failed.set()
+            raise
+
+    def _get_batch_of_comments_from_pushshift(self, from_utc):
+        """
+        Returns the next 100 comments after from_utc, as a list of dicts with at least the keys 'id' and 'created_utc'.
         For a list of posible arguments, see https://github.com/pushshift/api
         """
-        r = requests.get(
-            "https://api.pushshift.io/reddit/comment/search/",
+        self._pushshift_rate_limiter.wait()
+        r = self.session.get(
+            self.pushshift_url,
             params={
                 "author": self.author,
                 "size": 100,
@@ -44,13 +128,15 @@ class RedditUserCommentReader:
                 "sort_type": "created_utc",
             },
         )
-        data = r.json()
-        return [comment["id"] for comment in data["data"]]
+        r.raise_for_status()
+        return r.json()["data"]
 
     def _get_comment_data_from_reddit_api(self, comment_ids):
         headers = {"User-agent": "Comment Collector for /u/{}".format(self.author)}
         params = {"id": ",".join(["t1_" + id for id in comment_ids])}
-        r = requests.get("https://api.reddit.com/api/info", params=params, headers=headers)
+        self._reddit_rate_limiter.wait()
+        r = self.session.get(self.reddit_info_url, params=params, headers=headers)
+        r.raise_for_status()
         df = self._convert_comments_to_dataframe(r.json()["data"])
         return df
 
@@ -58,14 +144,21 @@ class RedditUserCommentReader:
     def _convert_comments_to_dataframe(comments):
         return pd.DataFrame([comment["data"] for comment in comments["children"]])
 
-    def _get_latest_read_comment_utc(self):
-        pickle_files = [f for f in glob.glob(f"{self.data_dir}/*.pickle")]
-        if len(pickle_files) < 1:
-            return None
-        else:
-            latest_utc_per_file = [int(re.findall(r"(\d+)\.pickle", x)[0]) for x in pickle_files]
-            return max(latest_utc_per_file)
-
-    def _read_all_pickle_files(self):
-        pickle_files = [f for f in glob.glob(f"{self.data_dir}/*.pickle")]
-        return pd.concat([pd.read_pickle(x) for x in pickle_files])
+
+class _RateLimiter:
+    """
+    Spaces calls to wait() at least 1 / requests_per_second seconds apart, across threads.
+    """
+
+    def __init__(self, requests_per_second):
+        self.interval = 1 / requests_per_second if requests_per_second else 0
+        self._next_time = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            wait_time = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
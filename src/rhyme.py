@@ -1,7 +1,16 @@
 import re
 import string
-import pronouncing
-import numpy as np
+from src import instrumentation
+from src.cache import LRUCache
+from src.cmudict_index import get_active_index
+from src.lazy import lazy_import
+from src.rhyme_trie import get_default_trie, to_key
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+pronouncing = lazy_import("pronouncing")
+
+_last_word = re.compile(r"\s([^\.?!,\s]+)[\.?!,\s']*$")
 
 
 def get_last_word(line):
@@ -18,11 +27,8 @@ def get_last_word(line):
     """
     line = line.strip(string.punctuation)
     line = line.strip()
-    return (
-        re.findall(r"\s([^\.?!,\s]+)[\.?!,\s']*$", line)[0]
-        if re.findall(r"\s([^\.?!,\s]+)[\.?!,\s']*$", line)
-        else None
-    )
+    match = _last_word.search(line)
+    return match.group(1) if match else None
 
 
 def get_last_words_list(poem):
@@ -32,6 +38,31 @@ def get_last_words_list(poem):
     return [get_last_word(line) for line in poem.split(">")]
 
 
+def extract_last_words(poems):
+    """
+    Returns a Series with the list of the last word for each line of every poem in the Series 'poems', like
+    poems.apply(get_last_words_list), but with a single pass of vectorized string operations over all lines.
+    The result has the same index as 'poems' and can be passed to get_rhyme_schemes().
+    """
+    with instrumentation.stage("rhyme.extract_last_words", rows=len(poems)):
+        lines = poems.str.split(">").explode()
+        last_words = lines.str.strip(string.punctuation).str.strip().str.extract(_last_word, expand=False)
+        last_words = last_words.to_numpy(dtype=object)
+        is_missing = pd.isna(last_words)
+        last_words[is_missing] = None
+    if instrumentation.enabled:
+        instrumentation.count("rhyme.extract_last_words", "lines", len(last_words))
+        instrumentation.count("rhyme.extract_last_words", "missing_last_words", int(is_missing.sum()))
+
+    # Every poem has one line more than it has '>', so the lines of poem i are offsets[i]:offsets[i+1].
+    offsets = np.concatenate([[0], np.cumsum(poems.str.count(">").to_numpy() + 1)])
+    return pd.Series(
+        [last_words[start:end].tolist() for start, end in zip(offsets[:-1], offsets[1:])],
+        index=poems.index,
+        dtype=object,
+    )
+
+
 def rhymes_all(word):
     """
     The original function prnouncing.rhymes only looks at the first (primary?) phonetical pronounciation
@@ -39,6 +70,9 @@ def rhymes_all(word):
     This function loops over all pronounciations and finds all rhyme words, so it makes 'live' rhyme with
     both 'five' and 'give'.
     """
+    index = get_active_index()
+    if index is not None:
+        return index.rhymes_all(word)
     phones = pronouncing.phones_for_word(word)
     if len(phones) > 0:
         return [
@@ -51,30 +85,118 @@ def rhymes_all(word):
         return []
 
 
-def get_rhyme_scheme(last_words_per_line):
+def rhymes(word):
+    """
+    Returns the words that rhyme with the first pronunciation of a word, like pronouncing.rhymes. Uses the
+    compiled CMUdict index if one is loaded with src.cmudict_index.use_index().
+    """
+    index = get_active_index()
+    if index is not None:
+        return index.rhymes(word)
+    return pronouncing.rhymes(word)
+
+
+def rhyming_parts(word):
+    """
+    Returns the rhyming parts of all pronunciations of a word, in the order of the pronunciations in CMUdict.
+    Two words rhyme if they share a rhyming part, see pronouncing.rhyming_part.
+    """
+    index = get_active_index()
+    if index is not None:
+        return index.rhyming_parts_for_word(word)
+    return [pronouncing.rhyming_part(phones) for phones in pronouncing.phones_for_word(word)]
+
+
+# The same line-ending words recur in thousands of poems, so the rhyming parts are cached process-wide. Use
+# rhyming_parts_cache.info() for the hit rate, and rhyming_parts_cache.save(path) / rhyming_parts_cache.load(path)
+# to keep the cache between runs. Keys are lowercase words.
+rhyming_parts_cache = LRUCache(lambda word: tuple(rhyming_parts(word)), maxsize=100000)
+# (rhyming part, max distance) -> keys of the near rhymes in the trie of src.rhyme_trie.
+_near_rhyme_keys_cache = LRUCache(lambda key: tuple(get_default_trie().search(*key)), maxsize=100000)
+
+
+def get_rhyme_schemes(last_words_lists, near_rhyme_distance=None):
+    """
+    Returns a Series with the rhyme scheme for every list of last words in the Series 'last_words_lists', such as
+    the result of df['poem_modified'].apply(get_last_words_list). The rhyming parts of every distinct word are
+    looked up only once for the whole Series. For near_rhyme_distance, see get_rhyme_scheme.
+    """
+    with instrumentation.stage("rhyme.get_rhyme_schemes", rows=len(last_words_lists)):
+        hits, misses = rhyming_parts_cache.hits, rhyming_parts_cache.misses
+        rhyme_schemes = [get_rhyme_scheme(last_words, near_rhyme_distance) for last_words in last_words_lists]
+    if instrumentation.enabled:
+        new_hits, new_misses = rhyming_parts_cache.hits - hits, rhyming_parts_cache.misses - misses
+        instrumentation.count("rhyme.get_rhyme_schemes", "rhyming_part_lookups", new_hits + new_misses)
+        instrumentation.count("rhyme.get_rhyme_schemes", "rhyming_part_lookup_misses", new_misses)
+        instrumentation.count("rhyme.get_rhyme_schemes", "unassigned_lines", sum(x.count("?") for x in rhyme_schemes))
+    return pd.Series(rhyme_schemes, index=last_words_lists.index, dtype=object)
+
+
+def get_rhyme_scheme(last_words_per_line, near_rhyme_distance=None):
     """
     Convert a list of words to a rhyme scheme represented as a string, such as 'aabb' if the first two
     words rhyme, and the last two words rhyme.
+
+    The first unassigned word gets the next letter, and so do all unassigned words that rhyme with its first
+    pronunciation. If no word in the poem rhymes with its first pronunciation, all its pronunciations are used.
+    Words are matched by their rhyming parts with dictionary lookups, instead of by searching the words in the
+    lists returned by rhymes() and rhymes_all().
+
+    near_rhyme_distance: If not None, a word that does not rhyme with any other word in the poem gets the same
+        letter as the words of which the rhyming part, without stress markers, is within this number of phoneme
+        edits of its own, e.g. 'time' and 'line' with a distance of 1. See src.rhyme_trie.
     """
     alphabet = string.ascii_lowercase
-    rhyme_scheme = np.empty(len(last_words_per_line), dtype=str)
+    # rhymes() looks up the lowercased word, but the words it returns are lowercase, so only lowercase words can
+    # be found in its result.
+    lines_per_rhyming_part = {}
+    for j, word in enumerate(last_words_per_line):
+        if word is not None and word == word.lower():
+            for rhyming_part in set(rhyming_parts_cache(word)):
+                lines_per_rhyming_part.setdefault(rhyming_part, []).append(j)
+
+    lines_per_near_rhyme_key = None
+    rhyme_scheme = [""] * len(last_words_per_line)
     k = 0
-    for i in range(len(last_words_per_line)):
-        if rhyme_scheme[i] == "":
-            if last_words_per_line[i] is not None:
-                rhyme_scheme[i] = alphabet[k % 26]
-                # determine rhyming words
-                rhyme_list = pronouncing.rhymes(last_words_per_line[i])
-                # if none of the rhyme words are found in the sentence, try with alternative pronounciations.
-                if not np.any([x in rhyme_list for x in last_words_per_line]):
-                    rhyme_list = rhymes_all(last_words_per_line[i])
-                # find the matching rhyme words and edit the rhyme_scheme
-                if np.any([x in rhyme_list for x in last_words_per_line]):
-                    rhyme_scheme[
-                        (np.array([x in rhyme_list for x in last_words_per_line]) & (rhyme_scheme == ""))
-                    ] = alphabet[k % 26]
-                k += 1
-            else:
-                rhyme_scheme[i] = "?"
+    for i, word in enumerate(last_words_per_line):
+        if rhyme_scheme[i] != "":
+            continue
+        if word is None:
+            rhyme_scheme[i] = "?"
+            continue
+        letter = alphabet[k % 26]
+        rhyme_scheme[i] = letter
+        word_rhyming_parts = rhyming_parts_cache(word.lower())
+        rhyming_lines = _get_rhyming_lines(word, word_rhyming_parts[:1], last_words_per_line, lines_per_rhyming_part)
+        if not rhyming_lines:
+            rhyming_lines = _get_rhyming_lines(word, word_rhyming_parts, last_words_per_line, lines_per_rhyming_part)
+        if not rhyming_lines and near_rhyme_distance is not None:
+            if lines_per_near_rhyme_key is None:
+                lines_per_near_rhyme_key = {}
+                for rhyming_part, lines in lines_per_rhyming_part.items():
+                    lines_per_near_rhyme_key.setdefault(to_key(rhyming_part), []).extend(lines)
+            near_rhyme_keys = {
+                key
+                for rhyming_part in word_rhyming_parts
+                for key in _near_rhyme_keys_cache((rhyming_part, near_rhyme_distance))
+            }
+            rhyming_lines = _get_rhyming_lines(word, near_rhyme_keys, last_words_per_line, lines_per_near_rhyme_key)
+        for j in rhyming_lines:
+            if rhyme_scheme[j] == "":
+                rhyme_scheme[j] = letter
+        k += 1
 
     return "".join(rhyme_scheme)
+
+
+def _get_rhyming_lines(word, word_rhyming_parts, last_words_per_line, lines_per_rhyming_part):
+    """
+    Returns the indices of the lines of which the last word shares one of 'word_rhyming_parts' and is not 'word'
+    itself.
+    """
+    return [
+        j
+        for rhyming_part in word_rhyming_parts
+        for j in lines_per_rhyming_part.get(rhyming_part, [])
+        if last_words_per_line[j] != word
+    ]
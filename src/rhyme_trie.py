@@ -0,0 +1,118 @@
+import re
+from src.lazy import lazy_import
+
+pronouncing = lazy_import("pronouncing")
+
+_default_trie = None
+_stress = re.compile(r"\d")
+
+
+class PhonemeSuffixTrie:
+    """
+    A trie over the rhyming parts in the CMU pronouncing dictionary, with the phonemes in reverse order and without
+    stress markers, to find near rhymes: words of which the rhyming part is within a Levenshtein distance of at
+    most 'max_distance' phonemes of the rhyming part of a given word. For example, 'time' (AY M) and 'line' (AY N)
+    are near rhymes at distance 1.
+
+    The search computes one row of the Levenshtein matrix per trie node, and skips the subtree below a node as
+    soon as all values in its row are larger than 'max_distance', so only a small part of the dictionary is
+    visited for small distances. Since the phonemes are reversed, rhyming parts with the same ending share their
+    rows.
+
+    Example:
+
+    > trie = PhonemeSuffixTrie.build()
+    > trie.search('AY1 M', max_distance=1)['AY N']
+    > 1
+    """
+
+    def __init__(self):
+        self.root = _Node()
+        self.words_per_key = {}
+
+    @classmethod
+    def build(cls):
+        """
+        Build the trie from the CMU pronouncing dictionary as shipped with the pronouncing package.
+        """
+        pronouncing.init_cmu()
+        trie = cls()
+        for word, phones in pronouncing.pronunciations:
+            trie.add(word, pronouncing.rhyming_part(phones))
+        return trie
+
+    def add(self, word, rhyming_part):
+        key = to_key(rhyming_part)
+        words = self.words_per_key.get(key)
+        if words is None:
+            words = self.words_per_key[key] = []
+            node = self.root
+            for phoneme in reversed(key.split(" ")):
+                node = node.children.setdefault(phoneme, _Node())
+            node.key = key
+        if word not in words:
+            words.append(word)
+
+    def search(self, rhyming_part, max_distance=1):
+        """
+        Returns a dict with the keys, i.e. the rhyming parts without stress markers, that are within 'max_distance'
+        of 'rhyming_part', and their distances.
+        """
+        target = list(reversed(to_key(rhyming_part).split(" ")))
+        first_row = list(range(len(target) + 1))
+        results = {}
+        stack = [(child, phoneme, first_row) for phoneme, child in self.root.children.items()]
+        while stack:
+            node, phoneme, previous_row = stack.pop()
+            row = [previous_row[0] + 1]
+            for i, target_phoneme in enumerate(target, start=1):
+                row.append(
+                    min(
+                        row[i - 1] + 1,
+                        previous_row[i] + 1,
+                        previous_row[i - 1] + (target_phoneme != phoneme),
+                    )
+                )
+            if node.key is not None and row[-1] <= max_distance:
+                results[node.key] = row[-1]
+            if min(row) <= max_distance:
+                stack.extend((child, child_phoneme, row) for child_phoneme, child in node.children.items())
+        return results
+
+    def near_rhymes(self, word, max_distance=1):
+        """
+        Returns the words that are near rhymes of any pronunciation of 'word', sorted by distance and then
+        alphabetically. Exact rhymes, apart from differences in stress, have distance 0.
+        """
+        distances = {}
+        for phones in pronouncing.phones_for_word(word):
+            for key, distance in self.search(pronouncing.rhyming_part(phones), max_distance).items():
+                for w in self.words_per_key[key]:
+                    distances[w] = min(distance, distances.get(w, distance))
+        distances.pop(word.lower(), None)
+        return sorted(distances, key=lambda w: (distances[w], w))
+
+
+class _Node:
+    __slots__ = ["children", "key"]
+
+    def __init__(self):
+        self.children = {}
+        self.key = None
+
+
+def to_key(rhyming_part):
+    """
+    Returns the rhyming part without stress markers, e.g. 'EY M' for 'EY1 M'.
+    """
+    return _stress.sub("", rhyming_part)
+
+
+def get_default_trie():
+    """
+    Returns the trie of the full CMU pronouncing dictionary, which is built on first use.
+    """
+    global _default_trie
+    if _default_trie is None:
+        _default_trie = PhonemeSuffixTrie.build()
+    return _default_trie
@@ -0,0 +1,105 @@
+import json
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import requests
+from src.reddit_user_comment_reader import RedditUserCommentReader
+
+
+class _StubServer:
+    """
+    Local stand-in for the Pushshift search and Reddit info endpoints, with n_comments comments of which the i-th
+    has created_utc 1000 + i. Info requests for a batch that contains an id in 'fail_ids' wait 'fail_delay' seconds
+    and then return a 500 error, so the later batches are ready before the batch fails.
+    """
+
+    def __init__(self, n_comments, fail_ids=(), fail_delay=0.0):
+        self.comments = [{"id": f"c{i}", "created_utc": 1000 + i} for i in range(n_comments)]
+        self.fail_ids = set(fail_ids)
+        self.fail_delay = fail_delay
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {key: values[0] for key, values in parse_qs(url.query).items()}
+                if url.path == "/pushshift":
+                    after = int(params["after"]) if params.get("after") not in (None, "None") else -1
+                    comments = [x for x in stub.comments if x["created_utc"] > after][: int(params["size"])]
+                    self._send(200, {"data": comments})
+                else:
+                    ids = [x[len("t1_") :] for x in params["id"].split(",")]
+                    if stub.fail_ids.intersection(ids):
+                        time.sleep(stub.fail_delay)
+                        self._send(500, {})
+                        return
+                    created_utc = {x["id"]: x["created_utc"] for x in stub.comments}
+                    children = [{"data": {"id": x, "created_utc": created_utc[x], "body": "a poem"}} for x in ids]
+                    self._send(200, {"data": {"children": children}})
+
+            def _send(self, status, body):
+                content = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class RedditUserCommentReaderTest(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.data_dir.cleanup()
+
+    def _get_reader(self, stub):
+        return RedditUserCommentReader(
+            "author",
+            self.data_dir.name,
+            max_in_flight=4,
+            requests_per_second=None,
+            pushshift_url=f"{stub.url}/pushshift",
+            reddit_info_url=f"{stub.url}/info",
+        )
+
+    def test_read_all_batches(self):
+        stub = _StubServer(450)
+        try:
+            df = self._get_reader(stub).read()
+        finally:
+            stub.close()
+        self.assertEqual(sorted(df["created_utc"]), list(range(1000, 1450)))
+
+    def test_failed_batch_is_not_skipped(self):
+        # The second batch, comments 100-199, fails after the third to fifth batch have been read.
+        stub = _StubServer(450, fail_ids=["c150"], fail_delay=0.5)
+        try:
+            reader = self._get_reader(stub)
+            with self.assertRaises(requests.HTTPError):
+                reader.read()
+            self.assertEqual(reader.store.get_high_water_mark(), 1099)
+
+            stub.fail_ids.clear()
+            df = reader.read()
+        finally:
+            stub.close()
+        self.assertEqual(sorted(df["created_utc"]), list(range(1000, 1450)))
+
+
+if __name__ == "__main__":
+    unittest.main()